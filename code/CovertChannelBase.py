@@ -1,7 +1,6 @@
 import string
 import time
 import random
-from scapy.all import send, sendp, ARP, LLC
 
 # You are not allowed to change CovertChannelBase class, please make your implementation in the MyCovertChannel class.
 class CovertChannelBase:
@@ -18,6 +17,8 @@ class CovertChannelBase:
         - You must send each packet by using this function.
         - Call this function with the packet and sender's interface (Default interface is "eth0" and you do not have to set unless there is a specific purpose.)
         """
+        # scapy takes about a second to import, so it is loaded on the first packet instead of with the module
+        from scapy.all import send, sendp, ARP, LLC
         if packet.haslayer(ARP) or packet.haslayer(LLC):
             sendp(packet, iface=interface, verbose=False)
         else:
@@ -3,7 +3,19 @@ import socket
 import time
 import random
 import hashlib
-from scapy.all import IP, UDP, Raw
+import os
+import json
+import math
+import struct
+import selectors
+import collections
+import itertools
+import bisect
+import heapq
+import string
+import contextlib
+import zlib
+from array import array
 import threading
 
 
@@ -14,11 +26,41 @@ class MyCovertChannel(CovertChannelBase):
     - Send functions are implemented in the `Sender` class.
     - Commonly used functions are implemented in the this class class.
     """
+    frame_cache: dict
+    """
+    Keys are (ip, port, payload, engine) tuples, values are the serialized frames ready to be written to the engine socket.
+    """
+    engine_sock: socket.socket
+    engine_kind: str
+    gso_size: int
+    """
+    Segment size set with `UDP_SEGMENT` on the "gso" engine socket, None if not set yet.
+    """
+    UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+    GSO_MAX_SEGMENTS = 64
+    """
+    Segments the kernel accepts in one `UDP_SEGMENT` send, larger bursts are sent in several calls.
+    """
+    GSO_MAX_BYTES = 65507
+    hamming_encode_table: list
+    """
+    Hamming(7,4) codewords of the 16 nibbles as 7-bit strings, bit order p1 p2 d1 p3 d2 d3 d4.
+    """
+    hamming_decode_table: dict
+    """
+    Keys are all 128 7-bit strings, values are the corrected nibbles as 4-bit strings.
+    """
+
     def __init__(self):
         """
         Initializes the covert channel. Parameters will be set dynamically.
         """
         super().__init__()
+        self.frame_cache = {}
+        self.engine_sock = None
+        self.engine_kind = None
+        self.gso_size = None
+        self.build_hamming_tables()
 
     def send(self, **params):
         """
@@ -50,14 +92,290 @@ class MyCovertChannel(CovertChannelBase):
         ords = [ord(c) for c in hist]
         sum_ords = sum(ords)
         check = sum_ords % 2
-        if check == 0:
+        burst_sizes[:] = self.shift_burst_sizes(burst_sizes, check, burst_max)
+            
+        return burst_sizes
+
+    def shift_burst_sizes(self, burst_sizes, parity, burst_max):
+        """
+        - Returns the burst sizes shifted for the given parity of the history sum, see `regenerate_burst_sizes`.
+        - If the parity is 0, it adds -1 to the burst sizes. Otherwise, it adds 1.
+        """
+        if parity == 0:
             additional = -1
         else:
             additional = 1
-        for i in range(len(burst_sizes)):
-            burst_sizes[i] = ((burst_sizes[i] + additional) % burst_max) + 1
-            
-        return burst_sizes
+        return [((size + additional) % burst_max) + 1 for size in burst_sizes]
+
+    def build_hamming_tables(self):
+        """
+        - Builds the encode and decode tables of the Hamming(7,4) code used by the "hamming" FEC.
+        - The decoder corrects any single flipped bit of a codeword.
+        """
+        self.hamming_encode_table = []
+        for nibble in range(16):
+            d1, d2, d3, d4 = (nibble >> 3) & 1, (nibble >> 2) & 1, (nibble >> 1) & 1, nibble & 1
+            codeword = [d1 ^ d2 ^ d4, d1 ^ d3 ^ d4, d1, d2 ^ d3 ^ d4, d2, d3, d4]
+            self.hamming_encode_table.append("".join(str(bit) for bit in codeword))
+        self.hamming_decode_table = {}
+        for value in range(128):
+            c = [int(bit) for bit in format(value, "07b")]
+            syndrome = (c[0] ^ c[2] ^ c[4] ^ c[6]) + 2 * (c[1] ^ c[2] ^ c[5] ^ c[6]) + 4 * (c[3] ^ c[4] ^ c[5] ^ c[6])
+            if syndrome:
+                c[syndrome - 1] ^= 1
+            self.hamming_decode_table[format(value, "07b")] = f"{c[2]}{c[4]}{c[5]}{c[6]}"
+
+    def coded_bit_count(self, fec):
+        """
+        Returns the number of bits a byte is sent as, 8 without FEC and 14 with the "hamming" FEC.
+        """
+        if fec is None:
+            return 8
+        if fec == "hamming":
+            return 14
+        raise ValueError(f"Unknown FEC: {fec}")
+
+    def fec_encode_byte(self, byte, fec):
+        """
+        - Returns the bits a byte is sent as.
+        - With the "hamming" FEC, both nibbles are encoded with Hamming(7,4) and the two codewords are interleaved bit by bit,
+          so one wrong symbol of up to 2 bits flips at most one bit of each codeword.
+        """
+        bits = format(byte, "08b")
+        if fec is None:
+            return bits
+        high = self.hamming_encode_table[byte >> 4]
+        low = self.hamming_encode_table[byte & 0x0F]
+        return "".join(h + l for h, l in zip(high, low))
+
+    def fec_decode_bits(self, bits, fec):
+        """
+        Returns the corrected 8 bits of a byte from the received bits, dropping the padding bits of the last symbol.
+        """
+        if fec is None:
+            return bits[:8]
+        return self.hamming_decode_table[bits[0:14:2]] + self.hamming_decode_table[bits[1:14:2]]
+
+    def byte_symbol_table(self, symbol_bits, fec=None):
+        """
+        - Returns the symbols of every byte value as a list of 256 lists of k-bit strings.
+        - With a FEC, the symbols carry the coded bits of the byte.
+        - The last symbol of a byte is padded with zeros if the number of bits is not a multiple of `symbol_bits`.
+        """
+        coded_bits = self.coded_bit_count(fec)
+        padded_length = -(-coded_bits // symbol_bits) * symbol_bits
+        table = []
+        for byte in range(256):
+            bits = self.fec_encode_byte(byte, fec).ljust(padded_length, "0")
+            table.append([bits[i:i + symbol_bits] for i in range(0, padded_length, symbol_bits)])
+        return table
+
+    def payload_chunks(self, payload, chunk_size, offset=0):
+        """
+        - Generator that yields the payload as chunks of bytes, starting `offset` bytes into it.
+        - The payload can be a file path (read lazily, `chunk_size` bytes at a time), a bytes object, or an iterator of byte chunks.
+        """
+        if isinstance(payload, str):
+            with open(payload, "rb") as payload_file:
+                payload_file.seek(offset)
+                while True:
+                    chunk = payload_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        elif isinstance(payload, (bytes, bytearray, memoryview)):
+            for i in range(offset, len(payload), chunk_size):
+                yield payload[i:i + chunk_size]
+        else:
+            for chunk in payload:
+                if offset >= len(chunk):
+                    offset -= len(chunk)
+                    continue
+                yield chunk[offset:]
+                offset = 0
+
+    def check_payload(self, payload, stopping_character, escape_character):
+        """
+        - Checks a bytes payload before anything is sent: without an escape character, raises ValueError if it contains the stopping character.
+        - Files and iterators are streamed and may be read only once, so they are not scanned ahead. `stuff_bytes` checks them while they are sent.
+        """
+        if escape_character is None and isinstance(payload, (bytes, bytearray, memoryview)) and ord(stopping_character) in payload:
+            raise ValueError("The payload contains the stopping character, set an escape_character to send it")
+
+    def stuff_bytes(self, chunks, stopping_character, escape_character):
+        """
+        - Generator that yields the bytes of the chunks, followed by the stopping character.
+        - Stopping and escape characters inside the payload are prefixed with the escape character, so any byte can be sent.
+        - Raises ValueError if the payload contains the stopping character and no escape character is set,
+          `check_payload` does the same check on a bytes payload before anything is sent.
+        """
+        stopping_byte = ord(stopping_character)
+        escape_byte = ord(escape_character) if escape_character is not None else None
+        for chunk in chunks:
+            for byte in chunk:
+                if byte == stopping_byte or byte == escape_byte:
+                    if escape_byte is None:
+                        raise ValueError("The payload contains the stopping character, set an escape_character to send it")
+                    yield escape_byte
+                yield byte
+        yield stopping_byte
+
+    def unstuff_bytes(self, data, stopping_character, escape_character):
+        """
+        Reverses `stuff_bytes`: drops the escape characters and cuts the data at the first unescaped stopping character.
+        """
+        stopping_byte = ord(stopping_character)
+        escape_byte = ord(escape_character) if escape_character is not None else None
+        payload = bytearray()
+        escaped = False
+        for byte in data:
+            if escaped:
+                escaped = False
+            elif byte == escape_byte:
+                escaped = True
+                continue
+            elif byte == stopping_byte:
+                break
+            payload.append(byte)
+        return bytes(payload)
+
+    def frame_bytes(self, index, chunk):
+        """
+        - Returns the bytes of one frame of the framed mode: frame index (2 bytes), chunk length (1 byte), chunk, checksum (1 byte).
+        - The checksum is the low byte of the CRC-32 of the index, length and chunk.
+        """
+        frame = struct.pack("!HB", index & 0xFFFF, len(chunk)) + bytes(chunk)
+        return frame + bytes([self.frame_checksum(frame)])
+
+    def frame_checksum(self, data):
+        """
+        Checksum of a frame, see `frame_bytes`.
+        """
+        return zlib.crc32(data) & 0xFF
+
+    def ack_bitmap(self, frames, count):
+        """
+        - Returns the feedback of the reliable mode: the number of frames `count` (4 bytes) and a bitmap with one bit per frame, most significant bit first.
+        - The bit of frame i is set if i is in `frames`, a cleared bit is a negative acknowledgement.
+        """
+        bitmap = bytearray((count + 7) // 8)
+        for index in frames:
+            if index < count:
+                bitmap[index // 8] |= 0x80 >> (index % 8)
+        return struct.pack("!I", count) + bytes(bitmap)
+
+    def acked_frames(self, feedback):
+        """
+        Returns the set of frames acknowledged by the feedback of `ack_bitmap`. Raises ValueError if the feedback is cut short.
+        """
+        if len(feedback) < 4:
+            raise ValueError("feedback is shorter than its header")
+        count, = struct.unpack_from("!I", feedback)
+        if len(feedback) < 4 + (count + 7) // 8:
+            raise ValueError("feedback is shorter than its bitmap")
+        return {index for index in range(count) if feedback[4 + index // 8] & (0x80 >> (index % 8))}
+
+    def random_message_weights(self, stopping_character, length=16):
+        """
+        - Returns the weights of the 256 byte values in the messages of `generate_random_message`, for a `HuffmanCode`.
+        - A random character is a space 50 times out of 363, one of the letters and digits 5 times each, or one of ",?!".
+          Every message of `length` characters ends with the stopping character.
+        - Every other byte value has the weight 1, so any payload can still be coded.
+        """
+        scale = 100
+        weights = [1] * 256
+        population = " " * 50 + (string.ascii_letters + string.digits) * 5 + ",?!"
+        for character in population:
+            weights[ord(character)] += scale * (length - 1)
+        weights[ord(stopping_character)] += scale * len(population)
+        return weights
+
+    def corpus_weights(self, corpus_file_name):
+        """
+        Returns the weights of the 256 byte values counted in a sample corpus file, plus 1 each so any payload can still be coded.
+        """
+        weights = [1] * 256
+        with open(corpus_file_name, "rb") as corpus_file:
+            for chunk in iter(lambda: corpus_file.read(65536), b""):
+                for byte, count in collections.Counter(chunk).items():
+                    weights[byte] += count
+        return weights
+
+    def payload_code(self, coding, corpus_file_name, stopping_character):
+        """
+        - Returns the `HuffmanCode` of the `coding` parameter, or None without coding.
+        - "huffman" uses the weights of a sample corpus if `corpus_file_name` is given, and the weights of `random_message_weights` otherwise.
+        """
+        if coding is None:
+            return None
+        if coding != "huffman":
+            raise ValueError(f"Unknown coding: {coding}")
+        if corpus_file_name is not None:
+            return HuffmanCode(self.corpus_weights(corpus_file_name))
+        return HuffmanCode(self.random_message_weights(stopping_character))
+
+    def symbol_signals(self, signal_order, symbol_bits):
+        """
+        - Returns the signals of the symbol alphabet as k-bit strings, k being `symbol_bits`, e.g. ['1', '0'] or ['00', '01', '10', '11'].
+        - The given signal order is used if it has 2^k entries, otherwise the natural order 0 .. 2^k - 1 is used.
+        """
+        if len(signal_order) != 2 ** symbol_bits:
+            signal_order = range(2 ** symbol_bits)
+        return [format(int(v), f"0{symbol_bits}b") for v in signal_order]
+
+    def gap_signals(self, shared_secret, gap_bits):
+        """
+        - Returns the signals of the gap classes as g-bit strings, g being `gap_bits`. Entry i is the signal of the i-th shortest gap.
+        - The order is derived from the shared secret with `hash_chunks`, as the burst sizes are, so both sides know it without sending it.
+        """
+        count = 2 ** gap_bits
+        chunks = self.hash_chunks(hashlib.sha256(f"{shared_secret}:gaps".encode()).hexdigest(), count)
+        order = sorted(range(count), key=lambda value: (chunks[value], value))
+        return [format(value, f"0{gap_bits}b") for value in order]
+
+    def hash_chunks(self, hashed, count):
+        """
+        - Splits a SHA-256 hex digest into `count` integers of 8 hex characters each.
+        - If the digest is too short, it is extended by hashing its last 64 characters again.
+        """
+        stream = hashed
+        while len(stream) < count * 8:
+            stream += hashlib.sha256(stream[-64:].encode()).hexdigest()
+        return [int(stream[i:i+8], 16) for i in range(0, count * 8, 8)]
+
+    def place_burst_sizes(self, chunks, burst_max, spacing):
+        """
+        - Turns hash chunks into burst sizes that are at least `spacing` apart on the circle 1 .. burst_max.
+        - `regenerate_burst_sizes` rotates the sizes on this circle, so they stay apart after every regeneration.
+        - Each chunk is reduced modulo burst_max; if the size is too close to an already placed size, the next sizes on the circle are tried.
+        - Returns None if a chunk cannot be placed, then the caller hashes again.
+        """
+        sizes = []
+        for chunk in chunks:
+            start = chunk % burst_max
+            for step in range(burst_max):
+                size = ((start + step) % burst_max) + 1
+                if all(min(abs(size - other), burst_max - abs(size - other)) >= spacing for other in sizes):
+                    sizes.append(size)
+                    break
+            else:
+                return None
+        return sizes
+
+    def decode_burst_size(self, burstsizes_to_signal, burst_size, tolerance=0):
+        """
+        - Returns the signal of a burst size.
+        - If the burst size is not in the table, the closest table size within `tolerance` packets is used.
+        - Raises KeyError if no table size is close enough.
+        """
+        signal = burstsizes_to_signal.get(burst_size)
+        if signal is not None:
+            return signal
+        if tolerance:
+            closest = min(burstsizes_to_signal, key=lambda size: abs(size - burst_size))
+            if abs(closest - burst_size) <= tolerance:
+                return burstsizes_to_signal[closest]
+        raise KeyError(burst_size)
 
     def to_sec(self, ms):
         """
@@ -68,6 +386,1206 @@ class MyCovertChannel(CovertChannelBase):
         """
         return ms / 1000
 
+    def calibration_log_file_name(self, log_file_name):
+        """
+        Returns the file name the calibration results are logged to, e.g. Receiver.log -> Receiver_calibration.log
+        """
+        base, extension = os.path.splitext(log_file_name)
+        return f"{base}_calibration{extension}"
+
+    def phase(self, metrics, name):
+        """
+        Returns a context manager that adds its duration to the `name` phase of `metrics`, or does nothing if metrics are disabled.
+        """
+        if metrics is None:
+            return contextlib.nullcontext()
+        return metrics.phase(name)
+
+    def start_profiler(self, profile):
+        """
+        Starts a cProfile profiler if a `profile` file name is given, returns None otherwise.
+        """
+        if profile is None:
+            return None
+        import cProfile  # Only loaded when a run is profiled, to keep the startup fast
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, profile):
+        """
+        Stops the profiler and dumps its statistics to the `profile` file, they can be read with `pstats`.
+        """
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+    def lane_file_name(self, file_name, lane):
+        """
+        Returns the file name used by a lane of the striped mode, e.g. Receiver.log -> Receiver_lane2.log
+        """
+        base, extension = os.path.splitext(file_name)
+        return f"{base}_lane{lane}{extension}"
+
+    def lane_params(self, params, lane, lanes):
+        """
+        - Returns the parameters of one lane of the striped mode, derived from the parameters of the whole channel.
+        - Lane i uses `port + i`, `calibration_port + i` and the shared secret followed by ":i", so every lane has its own burst table.
+        - Lanes write their logs and metrics to their own files and are not profiled.
+        """
+        port = params['port']
+        lane_params = dict(
+            params,
+            port=port + lane,
+            calibration_port=params.get('calibration_port', port + lanes) + lane,
+            shared_secret=f"{params['shared_secret']}:{lane}",
+            log_file_name=self.lane_file_name(params['log_file_name'], lane),
+            lanes=1,
+            profile=None,
+            )
+        if params.get('metrics') is not None:
+            lane_params['metrics'] = self.lane_file_name(params['metrics'], lane)
+        return lane_params
+
+    def split_stripes(self, data, lanes):
+        """
+        Splits the data into one stripe per lane, byte i goes to lane i % lanes.
+        """
+        return [bytes(data[lane::lanes]) for lane in range(lanes)]
+
+    def merge_stripes(self, stripes):
+        """
+        - Puts the stripes of all lanes back together in the original byte order.
+        - If a lane is short, the data is cut at the first missing byte.
+        """
+        lanes = len(stripes)
+        total = min(len(stripe) * lanes + lane for lane, stripe in enumerate(stripes))
+        data = bytearray(total)
+        for lane, stripe in enumerate(stripes):
+            data[lane::lanes] = stripe[:len(range(lane, total, lanes))]
+        return bytes(data)
+
+    def checksum(self, data):
+        """
+        Computes the 16-bit one's complement checksum used by the IP and UDP headers.
+        """
+        if len(data) % 2 == 1:
+            data += b"\0"
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+        while total >> 16:
+            total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
+
+    def build_udp_frame(self, ip, port, payload, engine="raw"):
+        """
+        - Builds the bytes written to the engine socket for one packet and caches them per (ip, port, payload, engine).
+        - For the "raw" engine it is a full IPv4/UDP frame with the same header values scapy uses by default (id 1, ttl 64, source port 53).
+        - For the "udp" and "gso" engines the kernel builds the headers, so the frame is only the payload.
+        """
+        key = (ip, port, payload, engine)
+        frame = self.frame_cache.get(key)
+        if frame is not None:
+            return frame
+        if engine in ("udp", "gso"):
+            frame = bytes(payload)
+        else:
+            dst = socket.gethostbyname(ip)
+            # Let the routing table pick the source address, as scapy does
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                probe.connect((dst, port))
+                src = probe.getsockname()[0]
+            finally:
+                probe.close()
+            src_bytes, dst_bytes = socket.inet_aton(src), socket.inet_aton(dst)
+            udp_length = 8 + len(payload)
+            pseudo_header = src_bytes + dst_bytes + struct.pack("!BBH", 0, socket.IPPROTO_UDP, udp_length)
+            udp_header = struct.pack("!HHHH", 53, port, udp_length, 0)
+            udp_checksum = self.checksum(pseudo_header + udp_header + payload) or 0xFFFF
+            udp_header = struct.pack("!HHHH", 53, port, udp_length, udp_checksum)
+            ip_header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + udp_length, 1, 0, 64, socket.IPPROTO_UDP, 0, src_bytes, dst_bytes)
+            ip_header = ip_header[:10] + struct.pack("!H", self.checksum(ip_header)) + ip_header[12:]
+            frame = ip_header + udp_header + payload
+        self.frame_cache[key] = frame
+        return frame
+
+    def open_send_engine(self, ip, port, engine="raw", socket_factory=socket.socket):
+        """
+        - Opens the socket used by the fast send engine and keeps it open until `close_send_engine` is called.
+        - "raw" opens a raw IPv4 socket (needs root, as scapy does) and writes pre-serialized frames.
+        - "udp" opens a plain UDP socket and lets the kernel build the headers.
+        - "gso" opens the same UDP socket, and `send_frames` hands a whole burst to the kernel in one call with `UDP_SEGMENT` (Linux 4.18+).
+        - The socket is connected to the receiver, so sending a packet is a single `send` call.
+        - `socket_factory` creates the "udp" socket, e.g. a simulated one.
+        """
+        if engine == "raw":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            sock.connect((socket.gethostbyname(ip), 0))
+        elif engine in ("udp", "gso"):
+            sock = socket_factory(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((ip, port))
+            self.gso_size = None
+        else:
+            raise ValueError(f"Unknown send engine: {engine}")
+        self.engine_sock = sock
+        self.engine_kind = engine
+        return sock
+
+    def send_frames(self, frame, count):
+        """
+        Sends the same pre-built frame `count` times through the open engine socket.
+        An ICMP port unreachable reported on a connected socket is ignored, the channel is fire-and-forget like the scapy path.
+        With the "gso" engine the frames are sent with `send_gso` instead, except empty frames, which `UDP_SEGMENT` cannot split.
+        """
+        if self.engine_kind == "gso" and frame:
+            self.send_gso(frame, count)
+            return
+        send = self.engine_sock.send
+        for _ in range(count):
+            try:
+                send(frame)
+            except ConnectionRefusedError:
+                pass
+
+    def send_gso(self, frame, count):
+        """
+        - Sends `count` copies of the frame as one buffer with `UDP_SEGMENT` set to the frame length,
+          and the kernel splits it into back-to-back datagrams, so a burst takes one system call.
+        - Bursts of more than `GSO_MAX_SEGMENTS` frames or `GSO_MAX_BYTES` bytes are sent in several calls.
+        - If the kernel does not support UDP GSO, the engine falls back to "udp" and sends the frames one by one.
+          Python has no `sendmmsg`, so there is no batched fallback.
+        """
+        sock = self.engine_sock
+        try:
+            if self.gso_size != len(frame):
+                sock.setsockopt(socket.IPPROTO_UDP, self.UDP_SEGMENT, len(frame))
+                self.gso_size = len(frame)
+            per_call = min(self.GSO_MAX_SEGMENTS, self.GSO_MAX_BYTES // len(frame))
+            while count > 0:
+                segments = min(count, per_call)
+                try:
+                    sock.send(frame * segments)
+                except ConnectionRefusedError:
+                    pass
+                count -= segments
+        except OSError:
+            self.engine_kind = "udp"
+            self.send_frames(frame, count)
+
+    def close_send_engine(self):
+        """
+        Closes the engine socket if it is open.
+        """
+        if self.engine_sock is not None:
+            self.engine_sock.close()
+            self.engine_sock = None
+            self.engine_kind = None
+
+class Histogram:
+    """
+    - Histogram with fixed bucket edges, its memory does not grow with the number of values.
+    - A value is counted in the first bucket whose edge is not smaller than it, values above the last edge go to an overflow bucket.
+    """
+    def __init__(self, edges, unit):
+        """
+        Constructor for the Histogram class.
+        """
+        self.edges = list(edges)
+        self.unit = unit
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """
+        Counts a value.
+        """
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def export(self):
+        """
+        Returns the histogram as a dictionary, only buckets with values are listed.
+        """
+        edges = self.edges + ["inf"]
+        return {
+            "unit": self.unit,
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "buckets": [{"le": edge, "count": count} for edge, count in zip(edges, self.counts) if count],
+        }
+
+
+class Metrics:
+    """
+    - Instrumentation of one `Sender.run` or `Receiver.run`, enabled with the `metrics` parameter.
+    - Per-packet and per-burst values go into fixed-memory histograms: recv latency and processing time of a packet,
+      burst duration, gap between bursts and burst size. With kernel timestamps, also the delay from the arrival of a packet to its processing,
+      and the gaps between the packets of a burst, taken from the arrival ring of the segmenter, which show the jitter inside a burst.
+    - The confusion table counts (expected, observed) burst sizes, where expected is the table size the burst was decoded to.
+    - Phases are the total times of the steps of a run, e.g. `generate_hash_based_burst_size`, `send_burst_sizes` and `send_main_data`.
+    - Everything is exported as JSON at the end of the run. When metrics are disabled the hot paths only check for None.
+    """
+    TIME_EDGES = [1e-6 * 2 ** i for i in range(25)]
+    """
+    Bucket edges of the time histograms in seconds, from 1 us to about 17 s.
+    """
+    DATA_PHASES = ("send_main_data", "send_payload", "receive_main_data", "receive_stream")
+    """
+    Phases in which the message bytes are sent or received, used for `bytes_per_second`.
+    """
+    def __init__(self, role, burst_max):
+        """
+        Constructor for the Metrics class, `role` is "sender" or "receiver".
+        """
+        self.role = role
+        self.histograms = {
+            "recv_latency": Histogram(self.TIME_EDGES, "s"),
+            "packet_processing": Histogram(self.TIME_EDGES, "s"),
+            "burst_duration": Histogram(self.TIME_EDGES, "s"),
+            "inter_burst_gap": Histogram(self.TIME_EDGES, "s"),
+            "arrival_delay": Histogram(self.TIME_EDGES, "s"),
+            "packet_gap": Histogram(self.TIME_EDGES, "s"),
+            "burst_size": Histogram(range(1, burst_max + 1), "packets"),
+        }
+        self.confusion = collections.Counter()
+        self.phases = {}
+        self.counters = {"packets": 0, "bursts": 0, "bytes": 0}
+        self.last_burst_end = None
+        self.pacer = None
+
+    def observe(self, name, value):
+        """
+        Adds a value to the `name` histogram.
+        """
+        self.histograms[name].add(value)
+
+    def burst(self, size, start, end):
+        """
+        Records a burst of `size` packets from `start` to `end` in seconds, and the gap since the end of the previous burst.
+        """
+        self.counters["bursts"] += 1
+        self.counters["packets"] += size
+        self.histograms["burst_size"].add(size)
+        self.histograms["burst_duration"].add(end - start)
+        if self.last_burst_end is not None:
+            self.histograms["inter_burst_gap"].add(start - self.last_burst_end)
+        self.last_burst_end = end
+
+    def confuse(self, expected, observed):
+        """
+        Counts a burst of `observed` packets that was decoded as the table size `expected`.
+        """
+        self.confusion[(expected, observed)] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager that adds its duration to the `name` phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def export(self):
+        """
+        Returns all metrics as a dictionary that can be dumped as JSON.
+        """
+        data_time = sum(self.phases.get(name, 0.0) for name in self.DATA_PHASES)
+        confusion = {}
+        for (expected, observed), count in sorted(self.confusion.items()):
+            confusion.setdefault(str(expected), {})[str(observed)] = count
+        return {
+            "role": self.role,
+            "phases": self.phases,
+            "counters": self.counters,
+            "bytes_per_second": self.counters["bytes"] / data_time if data_time else None,
+            "histograms": {name: histogram.export() for name, histogram in self.histograms.items()},
+            "burst_size_confusion": confusion,
+            "pacer": self.pacer.report() if self.pacer is not None else None,
+        }
+
+    def write(self, file_name):
+        """
+        Writes the exported metrics to a JSON file.
+        """
+        with open(file_name, "w") as f:
+            json.dump(self.export(), f, indent=2)
+
+
+class BurstPacer:
+    """
+    - Waits for the gap between two bursts of the sender.
+    - In the "deadline" mode the end of the gap is an absolute deadline on the monotonic clock. The pacer sleeps until `spin`
+      seconds before the deadline and spins for the rest, so the wake-up is not late by the overshoot of the OS sleep.
+    - The deadline is taken from the end of the burst, so a late burst is never made up with a shorter gap, which the receiver
+      could take for the inside of a burst. Every gap is timed on its own and the errors do not add up over the message.
+    - The "sleep" mode is a plain relative sleep, as the sender did before.
+    - The overshoot of every gap, the time between the requested and the achieved end of the gap, goes into a histogram.
+    """
+    def __init__(self, clock=time, mode="deadline", spin=0.001):
+        """
+        Constructor for the BurstPacer class. `clock` provides `monotonic()` and `sleep()`, `spin` is in seconds.
+        """
+        self.clock = clock
+        self.mode = mode
+        self.spin = spin
+        self.requested_gap = None
+        self.overshoot = Histogram(Metrics.TIME_EDGES, "s")
+
+    def wait(self, gap):
+        """
+        Waits `gap` seconds from now and records how late the wait ended.
+        """
+        monotonic = self.clock.monotonic
+        deadline = monotonic() + gap
+        self.requested_gap = gap
+        if self.mode == "sleep":
+            self.clock.sleep(gap)
+        else:
+            remaining = deadline - monotonic() - self.spin
+            if remaining > 0:
+                self.clock.sleep(remaining)
+            if self.spin > 0:
+                while monotonic() < deadline:
+                    # Lets other threads, e.g. a receiver in the same process, run while spinning
+                    self.clock.sleep(0)
+        self.overshoot.add(max(monotonic() - deadline, 0.0))
+
+    def report(self):
+        """
+        Returns the requested gap and the overshoot histogram of the achieved gaps as a dictionary.
+        """
+        return {
+            "mode": self.mode,
+            "spin": self.spin,
+            "requested_gap": self.requested_gap,
+            "overshoot": self.overshoot.export(),
+        }
+
+
+class CodecState:
+    """
+    - Rolling state of the burst size codec, used by both the sender and the receiver.
+    - It keeps the running sum of the ordinals of the last `history_size` characters,
+      so regenerating the burst sizes after a byte costs the same for every byte, no matter how long the message is.
+    - Sent or decoded bytes are appended to a bytearray output buffer.
+    - It gives the same burst sizes as calling `MyCovertChannel.regenerate_burst_sizes` with the whole history after every byte.
+    """
+    burst_sizes: list
+    """
+    Current burst sizes in signal order.
+    """
+    output: bytearray
+
+    def __init__(self, covert_channel, burst_sizes, burst_max, history_size, keep_output=True):
+        """
+        - Constructor for the CodecState class.
+        - It takes the burst sizes of the burst table in signal order.
+        - A `history_size` of 0 or less uses the whole history, as the string slice in `regenerate_burst_sizes` does.
+        - With `keep_output` False the bytes are not kept, so memory stays flat for streamed payloads.
+        """
+        self.covert_channel = covert_channel
+        self.burst_sizes = list(burst_sizes)
+        self.burst_max = burst_max
+        self.history_size = history_size
+        self.window = collections.deque()
+        self.window_sum = 0
+        self.keep_output = keep_output
+        self.output = bytearray()
+
+    def push(self, byte):
+        """
+        Appends a byte to the output and the history window and returns the regenerated burst sizes.
+        """
+        if self.keep_output:
+            self.output.append(byte)
+        self.window_sum += byte
+        if self.history_size > 0:
+            self.window.append(byte)
+            if len(self.window) > self.history_size:
+                self.window_sum -= self.window.popleft()
+        self.burst_sizes = self.covert_channel.shift_burst_sizes(self.burst_sizes, self.window_sum % 2, self.burst_max)
+        return self.burst_sizes
+
+
+class HuffmanCode:
+    """
+    - Static Huffman code of the 256 byte values, used by the `coding` parameter to send fewer bits per character.
+    - The code is built from fixed weights, so the sender and the receiver build the same code without sending it.
+      Ties are broken by byte value, so the code does not depend on the Python version.
+    - The code words are packed into bytes, which are sent as usual. The last byte is padded with zero bits.
+    """
+    codes: list
+    """
+    Code word of every byte value as a bit string, e.g. codes[32] = '110'.
+    """
+
+    def __init__(self, weights):
+        """
+        Constructor for the HuffmanCode class. It takes the weights of the 256 byte values, a larger weight gives a shorter code word.
+        """
+        heap = [(weight, byte, [byte]) for byte, weight in enumerate(weights)]
+        heapq.heapify(heap)
+        self.codes = [""] * 256
+        while len(heap) > 1:
+            weight_0, order_0, bytes_0 = heapq.heappop(heap)
+            weight_1, order_1, bytes_1 = heapq.heappop(heap)
+            for byte in bytes_0:
+                self.codes[byte] = "0" + self.codes[byte]
+            for byte in bytes_1:
+                self.codes[byte] = "1" + self.codes[byte]
+            heapq.heappush(heap, (weight_0 + weight_1, min(order_0, order_1), bytes_0 + bytes_1))
+        self.decode_table = {code: byte for byte, code in enumerate(self.codes)}
+
+    def encode(self, data):
+        """
+        - Generator that turns byte values into the bytes of their packed code words.
+        - `coded_bits` counts the code word bits and `source_bytes` the byte values, so the bits per character can be reported.
+        """
+        codes = self.codes
+        self.coded_bits = 0
+        self.source_bytes = 0
+        bits = ""
+        for byte in data:
+            bits += codes[byte]
+            self.source_bytes += 1
+            while len(bits) >= 8:
+                yield int(bits[:8], 2)
+                bits = bits[8:]
+                self.coded_bits += 8
+        if bits:
+            self.coded_bits += len(bits)
+            yield int(bits.ljust(8, "0"), 2)
+
+    def decode(self, data):
+        """
+        Generator that turns packed code words back into byte values. It never ends by itself, the padding bits may decode to extra values.
+        """
+        decode_table = self.decode_table
+        bits = ""
+        for byte in data:
+            for bit in format(byte, "08b"):
+                bits += bit
+                value = decode_table.get(bits)
+                if value is not None:
+                    yield value
+                    bits = ""
+
+
+class CheckpointSink:
+    """
+    - File sink of the streaming receiver that survives a crash of the receiver, see `Receiver.receive_stream`.
+    - Decoded bytes are buffered and appended to the file when `chunk_size` bytes are buffered or `flush_interval` ms have passed
+      since the last flush. Every flush is synced to disk.
+    - After every flush the number of bytes in the file is written to the checkpoint file, replacing the old one atomically,
+      so the checkpoint never counts bytes that are not on disk.
+    - With `resume`, the file is cut to the offset of the checkpoint and appended to, so a restarted transfer continues where the checkpoint was taken.
+    - The checkpoint is removed once the message is complete.
+    """
+    offset: int
+    """
+    Number of bytes in the file that are on disk, the offset of the last checkpoint.
+    """
+
+    def __init__(self, file_name, chunk_size, flush_interval, checkpoint_file_name=None, resume=False, clock=time):
+        """
+        Constructor for the CheckpointSink class. `flush_interval` is in milliseconds, `clock` needs monotonic().
+        """
+        self.checkpoint_file_name = checkpoint_file_name
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval / 1000
+        self.clock = clock
+        self.offset = 0
+        if resume and checkpoint_file_name is not None and os.path.exists(checkpoint_file_name) and os.path.exists(file_name):
+            with open(checkpoint_file_name) as checkpoint_file:
+                self.offset = json.load(checkpoint_file)["offset"]
+            self.file = open(file_name, "r+b")
+            self.file.truncate(self.offset)
+            self.file.seek(self.offset)
+        else:
+            self.file = open(file_name, "wb")
+        self.buffer = bytearray()
+        self.flush_deadline = clock.monotonic() + self.flush_interval
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Flushes and closes the file, also when decoding failed, so the bytes decoded so far are kept with their checkpoint.
+        """
+        self.flush()
+        self.file.close()
+
+    def append(self, byte):
+        """
+        Buffers one decoded byte and flushes the buffer when it is full or the flush interval has passed.
+        """
+        buffer = self.buffer
+        buffer.append(byte)
+        if len(buffer) >= self.chunk_size or self.clock.monotonic() >= self.flush_deadline:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered bytes to the file, syncs it to disk and writes the checkpoint.
+        """
+        self.flush_deadline = self.clock.monotonic() + self.flush_interval
+        if not self.buffer:
+            return
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.offset += len(self.buffer)
+        self.buffer.clear()
+        if self.checkpoint_file_name is not None:
+            temporary_file_name = self.checkpoint_file_name + ".tmp"
+            with open(temporary_file_name, "w") as checkpoint_file:
+                json.dump({"offset": self.offset, "time": time.time()}, checkpoint_file)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.replace(temporary_file_name, self.checkpoint_file_name)
+
+    def complete(self):
+        """
+        Marks the message as complete by removing the checkpoint, a later `resume` starts over.
+        """
+        self.flush()
+        if self.checkpoint_file_name is not None and os.path.exists(self.checkpoint_file_name):
+            os.remove(self.checkpoint_file_name)
+
+
+class BurstSegmenter:
+    """
+    - Splits the packet stream arriving on a bound socket into bursts by inter-arrival gaps.
+    - Runs as one long-lived selector loop, so no threads are started per burst.
+    - A burst ends when no packet arrives for `socket_awakening_delay` after the last packet,
+      or when `delay_waiting_for_burst` has passed since the first packet of the burst.
+    - With kernel timestamps, the bursts are split by the arrival times the kernel recorded for every packet instead of the time it is read.
+    - The gap before every burst is kept in `burst_gap` when the burst is yielded, for the gap classes of `gap_bits`.
+    - With an `idle_timeout` in seconds, a burst size of 0 is yielded when no packet arrives for that long, otherwise the segmenter waits forever.
+    """
+    sock: socket.socket
+    selector: selectors.BaseSelector
+    arrivals: array
+    """
+    Ring of the arrival times of the last `ring_size` packets in seconds, `arrival_count` is the total number of packets.
+    """
+    burst_gap: float
+    """
+    Time in seconds from the last packet of the previous burst to the first packet of the burst yielded last, None for the first burst.
+    """
+    SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+    """
+    Linux socket option that attaches the kernel receive time to every packet, missing from the socket module on some versions.
+    """
+    TIMESPEC = struct.Struct("@qq")
+
+    def __init__(self, sock, socket_awakening_delay, delay_waiting_for_burst, clock=time, selector_factory=selectors.DefaultSelector, metrics=None,
+                 timestamps="user", ring_size=4096):
+        """
+        - Constructor for the BurstSegmenter class.
+        - It puts the socket in non-blocking mode and registers it to a selector.
+        - Delays are given in milliseconds, as in the config file.
+        - `clock` provides `monotonic()` and `selector_factory` creates the selector, so both can be replaced by simulated ones.
+        - If `metrics` is given, the recv latency of every packet and every closed burst are recorded to it.
+        - `timestamps` is "user" (time the packet is read, from `clock`) or "kernel" (`SO_TIMESTAMPNS`, Linux only).
+        """
+        self.sock = sock
+        self.metrics = metrics
+        self.timestamps = timestamps
+        self.arrivals = array("d", bytes(8 * ring_size))
+        self.arrival_count = 0
+        self.burst_gap = None
+        self.idle_timeout = None
+        if timestamps == "kernel":
+            self.sock.setsockopt(socket.SOL_SOCKET, self.SO_TIMESTAMPNS, 1)
+        self.gap = socket_awakening_delay / 1000
+        self.window = delay_waiting_for_burst / 1000
+        self.clock = clock
+        self.buffer = bytearray(1024)
+        self.sock.setblocking(False)
+        self.selector = selector_factory()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+    def bursts(self):
+        """
+        Generator that yields the size of every burst as soon as the burst is closed.
+        A packet that arrives after the current burst is closed starts the next burst.
+        """
+        if self.timestamps == "kernel":
+            yield from self.kernel_bursts()
+            return
+        recv_into = self.sock.recv_into
+        select = self.selector.select
+        buffer = self.buffer
+        gap = self.gap
+        window = self.window
+        monotonic = self.clock.monotonic
+        metrics = self.metrics
+        perf_counter = time.perf_counter
+        count = 0
+        first = last = 0.0
+        previous = None
+        while True:
+            if count == 0:
+                timeout = self.idle_timeout
+            else:
+                timeout = max(0.0, min(last + gap, first + window) - monotonic())
+            if not select(timeout):
+                if count == 0:
+                    yield 0
+                else:
+                    if metrics is not None:
+                        metrics.burst(count, first, last)
+                    self.burst_gap = first - previous if previous is not None else None
+                    previous = last
+                    yield count
+                    count = 0
+                continue
+            while True:
+                if metrics is not None:
+                    start = perf_counter()
+                try:
+                    recv_into(buffer)
+                except BlockingIOError:
+                    break
+                if metrics is not None:
+                    metrics.observe("recv_latency", perf_counter() - start)
+                now = monotonic()
+                if count and (now - last > gap or now - first > window):
+                    if metrics is not None:
+                        metrics.burst(count, first, last)
+                    self.burst_gap = first - previous if previous is not None else None
+                    previous = last
+                    yield count
+                    count = 0
+                if count == 0:
+                    first = now
+                count += 1
+                last = now
+
+    def kernel_bursts(self):
+        """
+        - Same as `bursts`, but every packet is read with `recvmsg_into` into the preallocated buffer,
+          and the burst boundaries are decided by the kernel arrival time of the packet.
+        - A packet that waited in the socket queue while the receiver was busy still gets its real arrival time,
+          so scheduler delays do not merge or split bursts.
+        - Kernel timestamps are wall clock times, so the timeouts are computed with `time.time`.
+          A packet without a timestamp gets the time it is read.
+        - The arrival times are written to the `arrivals` ring and the burst boundaries are decided on the ring, which keeps the packets
+          of the open burst from index `head` on. A burst that fills the ring is closed, it is far larger than any burst of the table.
+        """
+        recvmsg_into = self.sock.recvmsg_into
+        select = self.selector.select
+        buffers = [self.buffer]
+        ancbufsize = socket.CMSG_SPACE(self.TIMESPEC.size)
+        unpack_from = self.TIMESPEC.unpack_from
+        sol_socket = socket.SOL_SOCKET
+        so_timestampns = self.SO_TIMESTAMPNS
+        arrivals = self.arrivals
+        ring_size = len(arrivals)
+        gap = self.gap
+        window = self.window
+        wall = time.time
+        metrics = self.metrics
+        perf_counter = time.perf_counter
+        count = 0
+        head = 0
+        previous = None
+        while True:
+            if count == 0:
+                timeout = self.idle_timeout
+            else:
+                first = arrivals[head % ring_size]
+                last = arrivals[(head + count - 1) % ring_size]
+                timeout = max(0.0, min(last + gap, first + window) - wall())
+            if not select(timeout):
+                if count == 0:
+                    yield 0
+                else:
+                    previous = self.ring_burst(head, count, previous)
+                    yield count
+                    count = 0
+                continue
+            while True:
+                if metrics is not None:
+                    start = perf_counter()
+                try:
+                    _, ancdata, _, _ = recvmsg_into(buffers, ancbufsize)
+                except BlockingIOError:
+                    break
+                if metrics is not None:
+                    metrics.observe("recv_latency", perf_counter() - start)
+                now = None
+                for level, kind, data in ancdata:
+                    if level == sol_socket and kind == so_timestampns:
+                        seconds, nanoseconds = unpack_from(data)
+                        now = seconds + nanoseconds * 1e-9
+                if now is None:
+                    now = wall()
+                elif metrics is not None:
+                    metrics.observe("arrival_delay", wall() - now)
+                index = self.arrival_count
+                if count and (count == ring_size or now - arrivals[(index - 1) % ring_size] > gap or now - arrivals[head % ring_size] > window):
+                    previous = self.ring_burst(head, count, previous)
+                    yield count
+                    count = 0
+                arrivals[index % ring_size] = now
+                self.arrival_count = index + 1
+                if count == 0:
+                    head = index
+                count += 1
+
+    def ring_burst(self, head, count, previous):
+        """
+        - Closes the burst of the `count` packets from packet `head` on in the `arrivals` ring, for `kernel_bursts`.
+        - Sets `burst_gap` from `previous`, the end of the previous burst, and records the burst and the gaps between its packets to the metrics.
+        - Returns the arrival time of the last packet of the burst.
+        """
+        arrivals = self.arrivals
+        ring_size = len(arrivals)
+        first = arrivals[head % ring_size]
+        last = arrivals[(head + count - 1) % ring_size]
+        if self.metrics is not None:
+            self.metrics.burst(count, first, last)
+            for index in range(head + 1, head + count):
+                self.metrics.observe("packet_gap", arrivals[index % ring_size] - arrivals[(index - 1) % ring_size])
+        self.burst_gap = first - previous if previous is not None else None
+        return last
+
+    def close(self):
+        """
+        Unregisters the socket and closes the selector. The socket itself is closed by its owner.
+        """
+        self.selector.close()
+
+
+class PacketRing:
+    """
+    - Splits the packets of the channel into bursts, as `BurstSegmenter` does with kernel timestamps, but reads them from a
+      memory-mapped TPACKET_V3 ring of an `AF_PACKET` socket instead of the UDP socket (Linux only, needs root or CAP_NET_RAW).
+    - A classic BPF filter attached to the socket keeps only incoming, unfragmented IPv4 UDP packets to the channel port,
+      cut to the headers, so the payloads are not copied into the ring.
+    - The kernel fills blocks of packets and hands a block over when it is full or `block_timeout` ms after its first packet.
+      Only the packet headers are read from the shared memory, one `unpack_from` per packet, and the block is then given back to the kernel.
+    - The burst boundaries are decided by the kernel arrival time of every packet. A burst is only closed by a timeout
+      `block_timeout` ms later than with the socket, since a packet may still be in a block that has not been handed over.
+    - The gap before the burst yielded last is kept in `burst_gap`, and a burst size of 0 is yielded after `idle_timeout`, as in `BurstSegmenter`.
+    """
+    SOL_PACKET = 263
+    PACKET_RX_RING = 5
+    PACKET_VERSION = 10
+    TPACKET_V3 = 2
+    TP_STATUS_USER = 1
+    ETH_P_IP = 0x0800
+    SO_ATTACH_FILTER = 26
+    SNAP_LENGTH = 64
+    """
+    Bytes of every packet kept in the ring, enough for the IPv4 and UDP headers.
+    """
+    BLOCK_HEADER = struct.Struct("=III")
+    """
+    block_status, num_pkts and offset_to_first_pkt of `struct tpacket_hdr_v1`, at offset 8 of a block.
+    """
+    PACKET_HEADER = struct.Struct("=III")
+    """
+    tp_next_offset, tp_sec and tp_nsec of `struct tpacket3_hdr`, at the start of every packet.
+    """
+
+    def __init__(self, port, interface, socket_awakening_delay, delay_waiting_for_burst, metrics=None, block_size=1 << 18, block_count=16,
+                 block_timeout=1):
+        """
+        - Constructor for the PacketRing class.
+        - Opens the `AF_PACKET` socket for IPv4 on `interface` (all interfaces if None), attaches the filter for `port`,
+          sets up the ring of `block_count` blocks of `block_size` bytes and maps it.
+        - Delays are given in milliseconds, as in the config file.
+        """
+        self.metrics = metrics
+        self.gap = socket_awakening_delay / 1000
+        self.window = delay_waiting_for_burst / 1000
+        self.block_size = block_size
+        self.block_count = block_count
+        self.block_timeout = block_timeout / 1000
+        # Only loaded by the ring engine, to keep the startup fast
+        import ctypes
+        import mmap
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(self.ETH_P_IP))
+        try:
+            self.filter = self.port_filter(port)
+            program = struct.pack("@HP", len(self.filter) // 8, ctypes.addressof(self.filter))
+            self.sock.setsockopt(socket.SOL_SOCKET, self.SO_ATTACH_FILTER, program)
+            self.sock.setsockopt(self.SOL_PACKET, self.PACKET_VERSION, self.TPACKET_V3)
+            frame_size = 2048
+            self.sock.setsockopt(self.SOL_PACKET, self.PACKET_RX_RING, struct.pack(
+                "=7I", block_size, block_count, frame_size, block_size * block_count // frame_size, block_timeout, 0, 0
+                ))
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_count, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            if interface is not None:
+                self.sock.bind((interface, self.ETH_P_IP))
+        except OSError:
+            self.sock.close()
+            raise
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.packet_count = 0
+        self.burst_gap = None
+        self.idle_timeout = None
+
+    def port_filter(self, port):
+        """
+        - Returns the classic BPF program that accepts incoming IPv4 UDP packets to `port`, as a ctypes buffer of `struct sock_filter`.
+        - With an `AF_PACKET` `SOCK_DGRAM` socket the offsets are relative to the IP header.
+        """
+        instructions = [
+            (0x20, 0, 0, 0xFFFFF004),       # ld packet type (SKF_AD_OFF + SKF_AD_PKTTYPE)
+            (0x15, 8, 0, 4),                # jeq PACKET_OUTGOING -> drop
+            (0x30, 0, 0, 9),                # ldb IP protocol
+            (0x15, 0, 6, socket.IPPROTO_UDP),  # jne UDP -> drop
+            (0x28, 0, 0, 6),                # ldh flags and fragment offset
+            (0x45, 4, 0, 0x1FFF),           # jset fragment offset -> drop
+            (0xB1, 0, 0, 0),                # ldx IP header length
+            (0x48, 0, 0, 2),                # ldh UDP destination port
+            (0x15, 0, 1, port),             # jne port -> drop
+            (0x06, 0, 0, self.SNAP_LENGTH),  # accept the headers
+            (0x06, 0, 0, 0),                # drop
+        ]
+        import ctypes  # Only loaded by the ring engine, to keep the startup fast
+        return ctypes.create_string_buffer(b"".join(struct.pack("=HBBI", *instruction) for instruction in instructions), 8 * len(instructions))
+
+    def packets(self, timeout):
+        """
+        - Generator that yields the kernel arrival time of every packet of the next block that is handed over, in seconds.
+        - Waits up to `timeout` seconds for a block (forever if None) and yields nothing if none comes.
+        - The block is given back to the kernel when the generator is exhausted.
+        """
+        ring = self.ring
+        offset = self.block * self.block_size
+        status, count, first = self.BLOCK_HEADER.unpack_from(ring, offset + 8)
+        if not status & self.TP_STATUS_USER:
+            if not self.selector.select(timeout):
+                return
+            status, count, first = self.BLOCK_HEADER.unpack_from(ring, offset + 8)
+            if not status & self.TP_STATUS_USER:
+                return
+        unpack_from = self.PACKET_HEADER.unpack_from
+        position = offset + first
+        for _ in range(count):
+            next_offset, seconds, nanoseconds = unpack_from(ring, position)
+            yield seconds + nanoseconds * 1e-9
+            position += next_offset
+        self.packet_count += count
+        struct.pack_into("=I", ring, offset + 8, 0)
+        self.block = (self.block + 1) % self.block_count
+
+    def bursts(self):
+        """
+        Generator that yields the size of every burst as soon as the burst is closed, with the same rules as `BurstSegmenter.kernel_bursts`.
+        """
+        self.block = 0
+        gap = self.gap
+        window = self.window
+        block_timeout = self.block_timeout
+        wall = time.time
+        metrics = self.metrics
+        count = 0
+        first = last = 0.0
+        previous = None
+        while True:
+            if count == 0:
+                timeout = self.idle_timeout + block_timeout if self.idle_timeout is not None else None
+            else:
+                timeout = max(0.0, min(last + gap, first + window) + block_timeout - wall())
+            arrived = False
+            for now in self.packets(timeout):
+                arrived = True
+                if metrics is not None:
+                    metrics.observe("arrival_delay", wall() - now)
+                if count and (now - last > gap or now - first > window):
+                    if metrics is not None:
+                        metrics.burst(count, first, last)
+                    self.burst_gap = first - previous if previous is not None else None
+                    previous = last
+                    yield count
+                    count = 0
+                if count == 0:
+                    first = now
+                count += 1
+                last = now
+            if not arrived and count == 0 and timeout is not None:
+                yield 0
+            elif not arrived and count and wall() >= min(last + gap, first + window) + block_timeout:
+                if metrics is not None:
+                    metrics.burst(count, first, last)
+                self.burst_gap = first - previous if previous is not None else None
+                previous = last
+                yield count
+                count = 0
+
+    def close(self):
+        """
+        Unmaps the ring and closes the `AF_PACKET` socket.
+        """
+        self.selector.close()
+        self.ring.close()
+        self.sock.close()
+
+
+class SessionDecoder:
+    """
+    - Decoding state of one sender in the multi-session receiver.
+    - It is fed with burst sizes and runs the same steps as `Receiver.receive_burst_sizes` and `Receiver.receive_main_data`:
+      first the burst table is learned, then every 8 bursts are decoded to a character and the table is regenerated from the history.
+    - It also keeps the burst segmentation state of its source, which is driven by `SessionProtocol`.
+    """
+    burstsizes_to_signal: dict
+    """
+    Keys are burst sizes, values are corresponding signals, e.g. {3= '0', 4= '1'}
+    """
+    timer: "asyncio.TimerHandle"
+
+    def __init__(self, receiver, addr):
+        """
+        - Constructor for the SessionDecoder class.
+        - It takes the receiver whose parameters are shared by all sessions and the source address of the session.
+        """
+        self.receiver = receiver
+        self.addr = addr
+        self.log_file_name = receiver.session_log_file_name(addr)
+        self.burstsizes_to_signal = {}
+        self.table_index = 0
+        self.byte_buffer = ""
+        self.codec = None
+        self.done = False
+        self.count = 0
+        self.first = 0.0
+        self.last = 0.0
+        self.timer = None
+
+    def feed(self, burst_size):
+        """
+        - Consumes one burst size.
+        - Returns True when the stopping character is decoded and the session is logged.
+        - Raises KeyError if the burst size is not in the current burst table, as `Receiver.receive_byte` does.
+        """
+        receiver = self.receiver
+        signal_order = receiver.signal_order
+        if self.table_index < len(signal_order):
+            self.burstsizes_to_signal[burst_size] = signal_order[self.table_index]
+            self.table_index += 1
+            if self.table_index == len(signal_order):
+                self.codec = CodecState(receiver.covert_channel, list(self.burstsizes_to_signal.keys()), receiver.burst_max, receiver.history_size)
+            return False
+        self.byte_buffer += receiver.covert_channel.decode_burst_size(
+            self.burstsizes_to_signal, burst_size, receiver.symbol_tolerance
+            )
+        if len(self.byte_buffer) < receiver.symbols_per_byte * receiver.symbol_bits:
+            return False
+        byte = int(receiver.covert_channel.fec_decode_bits(self.byte_buffer, receiver.fec), 2)
+        self.byte_buffer = ""
+        burst_sizes = self.codec.push(byte)
+        if byte == ord(receiver.stopping_character):
+            receiver.covert_channel.log_message(self.received_data(), self.log_file_name)
+            self.done = True
+            return True
+        self.burstsizes_to_signal = {k: v for k, v in zip(burst_sizes, signal_order)}
+        return False
+
+    def received_data(self):
+        """
+        Returns the data decoded so far as a string.
+        """
+        if self.codec is None:
+            return ""
+        return self.codec.output.decode("latin-1")
+
+
+class FrameDecoder:
+    """
+    - Decoding state of the framed mode. It is fed with burst sizes and returns every frame whose checksum is correct.
+    - A frame starts with a sync burst (`burst_max` + 2 packets, larger than any table size), followed by the burst table and the frame bytes,
+      see `Sender.send_framed`. The history starts empty in every frame, so a broken frame does not corrupt the next one.
+    - A frame is dropped when a sync burst comes in its middle, a burst size is unknown, the table is invalid or the checksum is wrong.
+      The decoder then waits for the next sync burst.
+    - The round end burst of the reliable mode (`burst_max` + 4 packets or more) is taken as a sync burst, the next round starts with one anyway.
+    """
+    burstsizes_to_signal: dict
+    """
+    Keys are burst sizes, values are corresponding signals, e.g. {3= '0', 4= '1'}
+    """
+
+    def __init__(self, receiver):
+        """
+        Constructor for the FrameDecoder class. It takes the receiver whose parameters are used.
+        """
+        self.receiver = receiver
+        self.state = "sync"
+        self.table = []
+        self.burstsizes_to_signal = {}
+        self.codec = None
+        self.byte_buffer = ""
+        self.frame = bytearray()
+        self.dropped = 0
+
+    def feed(self, burst_size):
+        """
+        - Consumes one burst size.
+        - Returns (frame index, chunk) when a frame is complete and its checksum is correct, None otherwise.
+        """
+        receiver = self.receiver
+        if burst_size > receiver.burst_max:
+            if self.state == "data":
+                self.drop()
+            self.state = "table"
+            self.table = []
+            return None
+        if self.state == "sync":
+            return None
+        if self.state == "table":
+            self.table.append(burst_size)
+            if len(set(self.table)) < len(self.table):
+                self.drop()
+            elif len(self.table) == len(receiver.signal_order):
+                self.burstsizes_to_signal = {k: v for k, v in zip(self.table, receiver.signal_order)}
+                self.codec = CodecState(receiver.covert_channel, list(self.table), receiver.burst_max, receiver.history_size, keep_output=False)
+                self.byte_buffer = ""
+                self.frame = bytearray()
+                self.state = "data"
+            return None
+        try:
+            self.byte_buffer += receiver.covert_channel.decode_burst_size(
+                self.burstsizes_to_signal, burst_size, receiver.symbol_tolerance
+                )
+        except KeyError:
+            self.drop()
+            return None
+        if len(self.byte_buffer) < receiver.symbols_per_byte * receiver.symbol_bits:
+            return None
+        byte = int(receiver.covert_channel.fec_decode_bits(self.byte_buffer, receiver.fec), 2)
+        self.byte_buffer = ""
+        burst_sizes = self.codec.push(byte)
+        self.burstsizes_to_signal = {k: v for k, v in zip(burst_sizes, receiver.signal_order)}
+        self.frame.append(byte)
+        if len(self.frame) == 3 and self.frame[2] > receiver.frame_size:
+            self.drop()
+            return None
+        if len(self.frame) < 3 or len(self.frame) < 4 + self.frame[2]:
+            return None
+        self.state = "sync"
+        if receiver.covert_channel.frame_checksum(bytes(self.frame[:-1])) != self.frame[-1]:
+            self.dropped += 1
+            return None
+        index, = struct.unpack_from("!H", self.frame)
+        return index, bytes(self.frame[3:-1])
+
+    def drop(self):
+        """
+        Drops the current frame and waits for the next sync burst.
+        """
+        self.dropped += 1
+        self.state = "sync"
+
+
+class SessionProtocol:
+    """
+    - asyncio datagram protocol of the multi-session receiver. It implements the `asyncio.DatagramProtocol` interface without
+      subclassing it, so asyncio is only imported when the sessions engine runs.
+    - Packets are demultiplexed by source address, every source gets its own `SessionDecoder`.
+    - Bursts are split per source by the same gap and window rules as `BurstSegmenter`, using loop timers instead of blocking waits.
+    """
+    sessions: dict
+    """
+    Keys are source addresses, values are the active `SessionDecoder` objects.
+    """
+
+    def __init__(self, receiver, loop):
+        """
+        Constructor for the SessionProtocol class. It takes the receiver that owns the sessions and the running event loop.
+        """
+        self.receiver = receiver
+        self.sessions = receiver.sessions
+        self.gap = receiver.covert_channel.to_sec(receiver.socket_awakening_delay)
+        self.window = receiver.covert_channel.to_sec(receiver.delay_waiting_for_burst)
+        self.loop = loop
+
+    def connection_made(self, transport):
+        """
+        Called by asyncio when the endpoint is bound, nothing to do.
+        """
+
+    def connection_lost(self, exc):
+        """
+        Called by asyncio when the endpoint is closed, nothing to do.
+        """
+
+    def error_received(self, exc):
+        """
+        Called by asyncio on an ICMP error for the socket, ignored like on the other receive engines.
+        """
+
+    def datagram_received(self, data, addr):
+        """
+        Adds the packet to the current burst of its source, closing the previous burst first if the packet is past its deadline.
+        """
+        session = self.sessions.get(addr)
+        if session is None:
+            session = SessionDecoder(self.receiver, addr)
+            self.sessions[addr] = session
+        now = self.loop.time()
+        if session.count and (now - session.last > self.gap or now - session.first > self.window):
+            self.close_burst(session)
+            if session.done or addr not in self.sessions:
+                return
+        if session.count == 0:
+            session.first = now
+            session.timer = self.loop.call_at(now + self.gap, self.check_burst, session)
+        session.count += 1
+        session.last = now
+
+    def check_burst(self, session):
+        """
+        Timer callback. Closes the burst if its deadline has passed, otherwise waits until the new deadline.
+        """
+        deadline = min(session.last + self.gap, session.first + self.window)
+        if self.loop.time() >= deadline:
+            self.close_burst(session)
+        else:
+            session.timer = self.loop.call_at(deadline, self.check_burst, session)
+
+    def close_burst(self, session):
+        """
+        Feeds the size of the closed burst to the session decoder and removes the session when it is finished or broken.
+        """
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+        burst_size = session.count
+        session.count = 0
+        try:
+            finished = session.feed(burst_size)
+        except Exception as e:
+            print(f"ERROR: An exception occurred in session {session.addr}: {e}")
+            del self.sessions[session.addr]
+            self.receiver.session_finished(session, success=False)
+            return
+        if finished:
+            del self.sessions[session.addr]
+            self.receiver.session_finished(session, success=True)
+
+
 class Receiver:
     """
     - Represents the receiver of the covert channel.
@@ -79,6 +1597,15 @@ class Receiver:
     """
     Keys are burst sizes, values are corresponding signals, e.g. {3= '0', 4= '1'}
     """
+    segmenter: BurstSegmenter
+    sessions: dict
+    """
+    Active sessions of the "sessions" receive engine, keys are source addresses, values are `SessionDecoder` objects.
+    """
+    finished_sessions: list
+    """
+    (source address, decoded data, success) tuples of the finished sessions.
+    """
     def __init__(self, covert_channel, params):
 
         """
@@ -91,52 +1618,317 @@ class Receiver:
         self.log_file_name = params['log_file_name']
         self.ip = params['ip']
         self.port = params['port']
-        self.signal_order = params['signal_order']
-        self.signal_order = [str(v) for v in self.signal_order]
+        self.symbol_bits = params.get('symbol_bits', 1)
+        self.symbol_spacing = params.get('symbol_spacing', 1)
+        self.signal_order = self.covert_channel.symbol_signals(params['signal_order'], self.symbol_bits)
         self.delay_waiting_for_burst = params['delay_waiting_for_burst']
         self.stopping_character = params['stopping_character']
         self.shared_secret = params['shared_secret']
         self.burst_max = params['burst_max']
         self.socket_awakening_delay = params['socket_awakening_delay']
+        self.fec = params.get('fec', None)
+        self.symbol_tolerance = (self.symbol_spacing - 1) // 2
+        if self.fec is not None:
+            # Any burst size is decoded to the closest signal and left to the FEC to correct
+            self.symbol_tolerance = self.burst_max
+        self.gap_bits = params.get('gap_bits', 0)
+        self.gap_order = self.covert_channel.gap_signals(self.shared_secret, self.gap_bits) if self.gap_bits else []
+        self.gap_centers = []
+        self.symbols_per_byte = -(-self.covert_channel.coded_bit_count(self.fec) // (self.symbol_bits + self.gap_bits))
         self.history_size = params['history_size']
+        self.receive_engine = params.get('receive_engine', 'segmenter')
+        if self.receive_engine not in ("segmenter", "threads", "sessions", "ring"):
+            raise ValueError(f"Unknown receive engine: {self.receive_engine}")
+        self.session_limit = params.get('session_limit', None)
+        self.calibration_probes = params.get('calibration_probes', 0)
+        self.calibration_margin = params.get('calibration_margin', 0.5)
+        self.calibration_port = params.get('calibration_port', self.port + params.get('lanes', 1))
+        self.calibration_timeout = params.get('calibration_timeout', 2000)
+        self.escape_character = params.get('escape_character', None)
+        self.sink = params.get('sink', None)
+        self.chunk_size = params.get('chunk_size', 65536)
+        self.flush_interval = params.get('flush_interval', 1000)
+        self.checkpoint = params.get('checkpoint', None)
+        self.resume = params.get('resume', False)
+        self.clock = params.get('clock', time)
+        self.socket_factory = params.get('socket_factory', socket.socket)
+        self.selector_factory = params.get('selector_factory', selectors.DefaultSelector)
+        self.metrics_file_name = params.get('metrics', None)
+        self.metrics = Metrics("receiver", self.burst_max) if self.metrics_file_name is not None else None
+        self.profile = params.get('profile', None)
+        self.lanes = params.get('lanes', 1)
+        self.frame_size = params.get('frame_size', None)
+        self.frame_timeout = params.get('frame_timeout', 10 * self.delay_waiting_for_burst)
+        self.frames = {}
+        self.missing_frames = []
+        self.arq = params.get('arq', False)
+        self.arq_ip = params.get('arq_ip', None)
+        self.coding = params.get('coding', None)
+        self.coder = self.covert_channel.payload_code(self.coding, params.get('coding_corpus', None), self.stopping_character)
+        self.decoded = bytearray()
+        self.receive_timestamps = params.get('receive_timestamps', 'user')
+        self.timestamp_ring_size = params.get('timestamp_ring_size', 4096)
+        self.ring_interface = params.get('ring_interface', None)
+        self.ring_block_size = params.get('ring_block_size', 1 << 18)
+        self.ring_block_count = params.get('ring_block_count', 16)
+        self.ring_block_timeout = params.get('ring_block_timeout', 1)
+        self.params = params
+        self.error = None
+        self.sessions = {}
+        self.finished_sessions = []
 
     def run(self):
 
         """
         - Runs the receiver.
         - Binds to the UDP socket and starts listening for incoming packets.
+        - If `calibration_probes` is set, calls `calibrate` first to choose the delays for this link.
+        - With the "segmenter" receive engine, one `BurstSegmenter` loop splits all incoming packets into bursts for the whole run.
+        - With the "ring" receive engine, the bursts are split from the `PacketRing` of an `AF_PACKET` socket instead.
+          The UDP socket stays bound, so the sender gets no port unreachable errors and calibration still works.
         - Calls `receive_burst_sizes` and `receive_main_data` to receive the burst sizes and the covert message.
         - Logs the received data to a file.
+        - If a `sink` is given, the message is decoded with `receive_stream` and written to the sink while it is received instead.
+        - With a `frame_size`, the message is received frame by frame with `receive_framed`, every frame carries its own burst table.
+          With `arq` as well, missing frames are requested again with `receive_reliable`.
         - Closes the socket at the end.
+        - With the "sessions" receive engine it runs the multi-session asyncio receiver instead.
+        - With more than one lane it runs the striped receiver, see `run_lanes`.
+        - If `metrics` is set, the metrics of the run are written to that JSON file at the end, and if `profile` is set the run is profiled.
         """
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.receive_engine == "sessions":
+            self.run_sessions()
+            return
+        if self.lanes > 1:
+            self.run_lanes()
+            return
+        profiler = self.covert_channel.start_profiler(self.profile)
+        phase = self.covert_channel.phase
+        self.sock = self.socket_factory(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.ip, self.port))
+        self.segmenter = None
 
         # print(f"Listening for incoming packets on {self.ip}:{self.port}...")
         try:
-            self.receive_burst_sizes()
-            received_data = self.receive_main_data()
-            self.covert_channel.log_message(received_data, self.log_file_name)
+            if self.calibration_probes:
+                with phase(self.metrics, "calibrate"):
+                    self.calibrate()
+            if self.receive_engine == "segmenter":
+                self.segmenter = BurstSegmenter(
+                    self.sock, self.socket_awakening_delay, self.delay_waiting_for_burst, self.clock, self.selector_factory, self.metrics,
+                    self.receive_timestamps, self.timestamp_ring_size
+                    )
+                self.burst_stream = self.segmenter.bursts()
+            elif self.receive_engine == "ring":
+                self.segmenter = PacketRing(
+                    self.port, self.ring_interface, self.socket_awakening_delay, self.delay_waiting_for_burst, self.metrics,
+                    self.ring_block_size, self.ring_block_count, self.ring_block_timeout
+                    )
+                self.burst_stream = self.segmenter.bursts()
+            if self.frame_size is not None:
+                with phase(self.metrics, "receive_main_data"):
+                    data = self.receive_reliable() if self.arq else self.receive_framed()
+                if self.coder is not None:
+                    data = self.decode_framed(data)
+                if self.sink is None:
+                    self.covert_channel.log_message(data.decode("latin-1"), self.log_file_name)
+                else:
+                    self.write_framed(self.covert_channel.unstuff_bytes(data, self.stopping_character, self.escape_character))
+                return
+            with phase(self.metrics, "receive_burst_sizes"):
+                self.receive_burst_sizes()
+            if self.sink is not None:
+                with phase(self.metrics, "receive_stream"):
+                    self.receive_stream()
+            else:
+                with phase(self.metrics, "receive_main_data"):
+                    received_data = self.receive_main_data()
+                self.covert_channel.log_message(received_data, self.log_file_name)
         except Exception as e:
+            self.error = e
             print(f"ERROR: An exception occurred in Receiver: {e}")
         finally:
+            if self.segmenter is not None:
+                self.segmenter.close()
             self.sock.close()
+            self.covert_channel.stop_profiler(profiler, self.profile)
+            if self.metrics is not None:
+                self.metrics.write(self.metrics_file_name)
+
+    def calibrate(self):
+        """
+        - Measures the probe bursts sent by `Sender.calibrate` and chooses the smallest safe delays for this link.
+        - Probe bursts have `burst_max` packets. The configured delays are used to split them into bursts.
+        - With m = 1 + `calibration_margin`, the delays are chosen as:
+            - socket_awakening_delay = largest gap between two packets of a burst * m (at least 1 ms)
+            - delay_waiting_for_burst = largest burst spread * m + socket_awakening_delay
+            - delay_between_bursts = delay_waiting_for_burst + max(socket_awakening_delay, burst interval jitter * m)
+        - If not all probes arrive, the configured delays are kept.
+        - The chosen delays are sent back to the sender on `calibration_port` and both sides log them.
+        """
+        to_sec = self.covert_channel.to_sec
+        expected = self.calibration_probes * self.burst_max
+        bursts = []
+        addr = None
+        received = 0
+        self.sock.settimeout(None)
+        while received < expected:
+            try:
+                _, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                break
+            now = self.clock.monotonic()
+            if not bursts or now - bursts[-1][-1] > to_sec(self.socket_awakening_delay):
+                bursts.append([])
+            bursts[-1].append(now)
+            received += 1
+            self.sock.settimeout(to_sec(self.calibration_timeout) / 2)
+        self.sock.settimeout(None)
+
+        calibration = {
+            "probes": len(bursts),
+            "configured": {
+                "delay_waiting_for_burst": self.delay_waiting_for_burst,
+                "socket_awakening_delay": self.socket_awakening_delay,
+            },
+        }
+        if len(bursts) == self.calibration_probes and all(len(burst) == self.burst_max for burst in bursts):
+            margin = 1 + self.calibration_margin
+            packet_gap = max((burst[i + 1] - burst[i] for burst in bursts for i in range(len(burst) - 1)), default=0) * 1000
+            spread = max(burst[-1] - burst[0] for burst in bursts) * 1000
+            intervals = [bursts[i + 1][0] - bursts[i][0] for i in range(len(bursts) - 1)]
+            jitter = (max(intervals) - min(intervals)) * 1000 if len(intervals) > 1 else 0
+            socket_awakening_delay = max(packet_gap * margin, 1.0)
+            delay_waiting_for_burst = spread * margin + socket_awakening_delay
+            delay_between_bursts = delay_waiting_for_burst + max(socket_awakening_delay, jitter * margin)
+            calibration["measured"] = {"max_packet_gap": packet_gap, "max_spread": spread, "interval_jitter": jitter}
+            self.socket_awakening_delay = math.ceil(socket_awakening_delay * 10) / 10
+            self.delay_waiting_for_burst = math.ceil(delay_waiting_for_burst * 10) / 10
+            delay_between_bursts = math.ceil(delay_between_bursts * 10) / 10
+        else:
+            delay_between_bursts = None
+        calibration["chosen"] = {
+            "delay_between_bursts": delay_between_bursts,
+            "delay_waiting_for_burst": self.delay_waiting_for_burst,
+            "socket_awakening_delay": self.socket_awakening_delay,
+        }
+        if addr is not None:
+            reply = json.dumps(calibration["chosen"]).encode()
+            for _ in range(3):
+                self.sock.sendto(reply, (addr[0], self.calibration_port))
+        self.covert_channel.log_message(
+            json.dumps(calibration, indent=2),
+            self.covert_channel.calibration_log_file_name(self.log_file_name)
+            )
+
+
+    def run_lanes(self):
+        """
+        - Runs the striped receiver: one `Receiver` per lane in its own thread, see `MyCovertChannel.lane_params`.
+        - Every lane decodes its stripe into memory, the stripes are merged in order when all lanes are finished.
+        - The merged message is written to the sink, or logged with the stopping character as in the single lane mode.
+        """
+        stripes = [bytearray() for _ in range(self.lanes)]
+        receivers = []
+        for lane in range(self.lanes):
+            lane_params = self.covert_channel.lane_params(self.params, lane, self.lanes)
+            lane_params['sink'] = stripes[lane].extend
+            receivers.append(Receiver(type(self.covert_channel)(), lane_params))
+        threads = [threading.Thread(target=receiver.run) for receiver in receivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        errors = [receiver.error for receiver in receivers if receiver.error is not None]
+        if errors:
+            self.error = errors[0]
+            print(f"ERROR: {len(errors)} of {self.lanes} lanes failed, the message is cut at the first missing byte")
+        data = self.covert_channel.merge_stripes(stripes)
+        if self.sink is None:
+            self.covert_channel.log_message(data.decode("latin-1") + self.stopping_character, self.log_file_name)
+        elif callable(self.sink):
+            self.sink(data)
+        else:
+            with open(self.sink, "wb") as sink_file:
+                sink_file.write(data)
+
+    def run_sessions(self):
+        """
+        - Runs the multi-session receiver on an asyncio event loop.
+        - Every source address is decoded independently and logged to its own file, see `session_log_file_name`.
+        - It runs until `session_limit` sessions are finished, or forever if no limit is given.
+        - Sessions are decoded without `coding` and without gap classes.
+        """
+        self.check_session_params("the sessions receive engine")
+        import asyncio  # Only loaded by the sessions engine, to keep the startup fast
+        asyncio.run(self.serve_sessions())
+
+    def check_session_params(self, decoder):
+        """
+        - Raises ValueError for the parameters that `SessionDecoder` does not decode, instead of logging a wrong message as a successful session.
+        - Used by `run_sessions` and the offline capture decoder, `decoder` names the caller in the error.
+        """
+        if self.coder is not None:
+            raise ValueError(f"coding is not supported by {decoder}")
+        if self.gap_bits:
+            raise ValueError(f"gap_bits is not supported by {decoder}")
+        if self.escape_character is not None:
+            raise ValueError(f"escape_character is not supported by {decoder}")
+        if self.frame_size is not None:
+            raise ValueError(f"frame_size is not supported by {decoder}")
+        if self.lanes > 1:
+            raise ValueError(f"lanes are not supported by {decoder}")
 
+    async def serve_sessions(self):
+        """
+        Binds the datagram endpoint and waits until the session limit is reached.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        self.sessions_done = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: SessionProtocol(self, loop),
+            local_addr=(self.ip, self.port)
+            )
+        try:
+            await self.sessions_done
+        finally:
+            transport.close()
+
+    def session_log_file_name(self, addr):
+        """
+        Returns the log file name of a session, e.g. Receiver.log -> Receiver_172.18.0.2_53.log
+        """
+        base, extension = os.path.splitext(self.log_file_name)
+        return f"{base}_{addr[0]}_{addr[1]}{extension}"
+
+    def session_finished(self, session, success):
+        """
+        Records a finished session and stops the multi-session receiver when the session limit is reached.
+        """
+        self.finished_sessions.append((session.addr, session.received_data(), success))
+        if self.session_limit is not None and len(self.finished_sessions) >= self.session_limit:
+            if not self.sessions_done.done():
+                self.sessions_done.set_result(None)
 
     def receive_burst(self):
         """
         Receives a single burst and counts the number of packets.
-        Starts timing after the first message and stops after stop signal and timeout.
+        With the "segmenter" and "ring" receive engines the next burst size is taken from the long-lived burst stream.
+        With the "threads" receive engine it starts timing after the first message and stops after stop signal and timeout.
         """
+        if self.receive_engine in ("segmenter", "ring"):
+            return next(self.burst_stream)
         burst_count = 0
         start_t = None  # Start time for the burst
+        last_t = None  # Arrival time of the last packet of the burst
+        txs = []  # recv latency of every packet
+        tys = []  # Processing time of every packet
         stop_event = threading.Event()  # Event to stop the collector thread
         first_message_event = threading.Event()  # Event to signal the arrival of the first message
 
         def collect_messages():
-            nonlocal burst_count, start_t
-            txs = []
-            tys = []
+            nonlocal burst_count, start_t, last_t
             try:
                 self.sock.settimeout(None)  # Avoid indefinite blocking
                 while not stop_event.is_set():
@@ -153,6 +1945,7 @@ class Receiver:
                             first_message_event.set()  # Signal that the first message has arrived
                             self.sock.settimeout(self.covert_channel.to_sec(self.socket_awakening_delay))  # Avoid indefinite blocking
                         burst_count += 1
+                        last_t = current_time
                         t3 = time.time()
                         tys.append(t3-t2)
                     except socket.timeout:
@@ -181,7 +1974,12 @@ class Receiver:
         timer_thread.join()  # Ensure the timer thread finishes first
         collector_thread.join()  # Then ensure the collector thread stops
 
-        # Calculate time intervals between packets
+        if self.metrics is not None:
+            for tx, ty in zip(txs, tys):
+                self.metrics.observe("recv_latency", tx)
+                self.metrics.observe("packet_processing", ty)
+            if burst_count:
+                self.metrics.burst(burst_count, start_t, last_t)
 
         return burst_count
 
@@ -199,29 +1997,63 @@ class Receiver:
             while burst_count == 0:
                 burst_count = self.receive_burst()
             self.burstsizes_to_signal[burst_count] = signal
+        if self.gap_bits:
+            self.receive_gap_classes()
         
         # print(f"DEBUG: Received burst_sizes_to_signal: {self.burstsizes_to_signal}")
 
+    def receive_gap_classes(self):
+        """
+        - Learns the gap of every gap class from the training bursts of `Sender.send_gap_classes`, which follow the burst sizes.
+        - The i-th training burst comes after a gap of class i, its measured gap is kept as the center of the class in `gap_centers`.
+        - Needs the gap before every burst, which only the "segmenter" and "ring" receive engines measure.
+        """
+        if self.segmenter is None:
+            raise ValueError("gap_bits needs the segmenter or ring receive engine")
+        self.gap_centers = []
+        for _ in self.gap_order:
+            while self.receive_burst() == 0:
+                pass
+            self.gap_centers.append(self.segmenter.burst_gap)
+
+    def decode_gap(self, gap):
+        """
+        Returns the signal of the gap class whose center is closest to the measured gap.
+        """
+        centers = self.gap_centers
+        closest = min(range(len(centers)), key=lambda index: abs(centers[index] - gap))
+        return self.gap_order[closest]
+
     def receive_byte(self):
         """
         Receives and decodes a single byte from the covert message.
-        The byte is received 8 bits at a time, with each bit represented by a burst size.
+        The byte is received `symbol_bits` bits at a time, with each symbol represented by a burst size.
+        With `gap_bits`, every burst also carries the bits of the gap class of the gap before it, see `decode_gap`.
         The burst size is converted to a signal using the burst sizes dictionary.
         The signal is then appended to the byte buffer.
-        The process is repeated until all 8 bits have been received.
+        The process is repeated until all 8 bits have been received, the padding bits of the last symbol are dropped.
+        With a FEC, the coded bits of the byte are received and corrected before the byte is returned,
+        so a miscounted burst does not get into the history.
         :return: The decoded byte as a string of 0s and 1s.
         """
         byte_buffer = ""
         burst_count = 0
-        while burst_count < 8:
+        while burst_count < self.symbols_per_byte:
             burst_size = 0
             while burst_size == 0:
                 burst_size = self.receive_burst()
-            decoded_signal = self.burstsizes_to_signal[burst_size]
+            decoded_signal = self.covert_channel.decode_burst_size(
+                self.burstsizes_to_signal, burst_size, self.symbol_tolerance
+                )
+            if self.gap_bits:
+                byte_buffer += self.decode_gap(self.segmenter.burst_gap)
             byte_buffer += decoded_signal
             burst_count += 1
+            if self.metrics is not None:
+                expected = next(size for size, signal in self.burstsizes_to_signal.items() if signal == decoded_signal)
+                self.metrics.confuse(expected, burst_size)
 
-        return byte_buffer
+        return self.covert_channel.fec_decode_bits(byte_buffer, self.fec)
     
     def receive_main_data(self):
         """
@@ -230,33 +2062,223 @@ class Receiver:
         The covert message is received one byte at a time, with each byte being
         represented by 8 bits. Each bit is represented by a burst size, which
         is decoded using the burst sizes dictionary. The decoded byte is then
-        converted to a character and appended to the received data string.
+        appended to the output buffer of the `CodecState`, which also regenerates the burst sizes.
 
         The process is repeated until the stopping character is received.
 
         :return: The decoded message as a string.
         """
-        received_data = ""
+        for _ in self.decode_bytes(keep_output=True):
+            pass
+        if self.coder is not None:
+            return self.decoded.decode("latin-1")
+        return self.codec.output.decode("latin-1")
+
+    def received_bytes(self, keep_output=False):
+        """
+        - Generator that receives the bytes of the covert message one by one, and regenerates the burst sizes after every byte.
+        - These are the bytes that were sent, still coded with the `coding`.
+        """
+        self.codec = CodecState(self.covert_channel, list(self.burstsizes_to_signal.keys()), self.burst_max, self.history_size, keep_output)
+        metrics = self.metrics
         while True:
             byte_buffer = self.receive_byte()
-            # Convert the 8-bit byte buffer to a character
-            char = self.covert_channel.convert_eight_bits_to_character(byte_buffer)
-            # Append the character to the received data
-            received_data += char
-            # Check if we have reached the stopping character
-            if char == self.stopping_character:    
-                break
-            # print(f"DEBUG: Current Data: {received_data}")
-            # Regenerate the burst sizes dictionary based on the current data
-            burst_sizes = self.covert_channel.regenerate_burst_sizes(
-                list(self.burstsizes_to_signal.keys()),
-                received_data,
-                self.burst_max,
-                self.history_size
-                )
+            if metrics is not None:
+                metrics.counters["bytes"] += 1
+            # Convert the 8-bit byte buffer to a byte and regenerate the burst sizes
+            byte = int(byte_buffer, 2)
+            burst_sizes = self.codec.push(byte)
             # Update the burst sizes dictionary
             self.burstsizes_to_signal = {k: v for k, v in zip(burst_sizes, self.signal_order)}
-        return received_data
+            yield byte
+
+    def decode_bytes(self, keep_output=False):
+        """
+        - Generator that receives and decodes the covert message and yields the payload bytes one by one as they are decoded.
+        - The burst sizes are regenerated after every received byte, including escape characters.
+        - With a `coding`, the received bytes are decoded with the `HuffmanCode` first, and the characters it decodes are kept in `decoded`.
+        - An escaped byte is yielded without its escape character, an unescaped stopping character ends the message.
+        """
+        stopping_byte = ord(self.stopping_character)
+        escape_byte = ord(self.escape_character) if self.escape_character is not None else None
+        escaped = False
+        if self.coder is None:
+            symbols = self.received_bytes(keep_output)
+            decoded = None
+        else:
+            symbols = self.coder.decode(self.received_bytes())
+            decoded = bytearray() if keep_output else None
+            self.decoded = decoded if keep_output else bytearray()
+        for byte in symbols:
+            if decoded is not None:
+                decoded.append(byte)
+            if escaped:
+                escaped = False
+            elif byte == escape_byte:
+                escaped = True
+                continue
+            elif byte == stopping_byte:
+                # Reached the stopping character
+                return
+            yield byte
+
+    def receive_framed(self):
+        """
+        - Receives the message in frames with a `FrameDecoder`, see `Sender.send_framed`.
+        - Frames are kept by index in `frames`, so a repeated frame is only kept once. The message ends with the first frame
+          that is shorter than `frame_size`.
+        - Once a frame has arrived, the message also ends when no burst arrives for `frame_timeout` ms, so a lost last frame does not block the receiver.
+          This needs the "segmenter" or "ring" receive engine.
+        - Frames that were dropped are listed in `missing_frames` and reported, the message is put together from the frames that arrived.
+        - Returns the received bytes, including escape characters and the stopping character, as `receive_main_data` does.
+        """
+        if self.gap_bits:
+            raise ValueError("gap_bits is not supported in the framed mode")
+        decoder = FrameDecoder(self)
+        self.frames = {}
+        last = None
+        try:
+            while True:
+                burst_size = self.receive_burst()
+                if burst_size == 0:
+                    if self.segmenter is not None and self.segmenter.idle_timeout is not None:
+                        print(f"ERROR: No burst for {self.frame_timeout} ms, the last frame was not received")
+                        break
+                    continue
+                frame = decoder.feed(burst_size)
+                if frame is None:
+                    continue
+                if self.segmenter is not None:
+                    self.segmenter.idle_timeout = self.covert_channel.to_sec(self.frame_timeout)
+                index, chunk = frame
+                self.frames[index] = chunk
+                if len(chunk) < self.frame_size:
+                    last = index
+                    break
+        finally:
+            if self.segmenter is not None:
+                self.segmenter.idle_timeout = None
+        count = last + 1 if last is not None else max(self.frames) + 1
+        self.missing_frames = [i for i in range(count) if i not in self.frames]
+        if self.missing_frames:
+            print(f"ERROR: {len(self.missing_frames)} of {count} frames were dropped: {self.missing_frames}")
+        return b"".join(self.frames.get(i, b"") for i in range(count))
+
+    def receive_reliable(self):
+        """
+        - Receives the message in frames as `receive_framed` does, and asks the sender to send the missing frames again, see `Sender.send_reliable`.
+        - The sender ends every round with a round end burst. The receiver answers it with the frames it has, as an `ack_bitmap`,
+          sent to `arq_ip` on `calibration_port`. The bitmap covers the frames up to the highest index received, the sender takes the frames above it as missing.
+        - Once the last frame (the one shorter than `frame_size`) and all frames before it have arrived, the full bitmap is sent 3 times
+          without waiting for the round end, and the message is returned as in `receive_framed`.
+        - Once a frame has arrived, the receiver gives up when no burst arrives for `frame_timeout` ms, which should be longer than the `arq_timeout`
+          of the sender. The frames that did not arrive are listed in `missing_frames` and reported, the message is put together from the others.
+          This needs the "segmenter" or "ring" receive engine.
+        """
+        if self.arq_ip is None:
+            raise ValueError("arq needs arq_ip, the address the feedback is sent to")
+        if self.gap_bits:
+            raise ValueError("gap_bits is not supported in the framed mode")
+        decoder = FrameDecoder(self)
+        self.frames = {}
+        address = (self.arq_ip, self.calibration_port)
+        round_end = self.burst_max + 4
+        last = None
+        try:
+            while True:
+                burst_size = self.receive_burst()
+                if burst_size == 0:
+                    if self.segmenter is not None and self.segmenter.idle_timeout is not None:
+                        print(f"ERROR: No burst for {self.frame_timeout} ms, the sender stopped before the message was complete")
+                        break
+                    continue
+                if burst_size >= round_end:
+                    decoder.feed(burst_size)
+                    count = max(self.frames) + 1 if self.frames else 0
+                    self.sock.sendto(self.covert_channel.ack_bitmap(self.frames, count), address)
+                    continue
+                frame = decoder.feed(burst_size)
+                if frame is None:
+                    continue
+                if self.segmenter is not None:
+                    self.segmenter.idle_timeout = self.covert_channel.to_sec(self.frame_timeout)
+                index, chunk = frame
+                self.frames[index] = chunk
+                if len(chunk) < self.frame_size:
+                    last = index
+                if last is not None and len(self.frames) == last + 1:
+                    break
+        finally:
+            if self.segmenter is not None:
+                self.segmenter.idle_timeout = None
+        count = last + 1 if last is not None else max(self.frames) + 1
+        self.missing_frames = [i for i in range(count) if i not in self.frames]
+        if self.missing_frames:
+            print(f"ERROR: {len(self.missing_frames)} of {count} frames were not received: {self.missing_frames}")
+            return b"".join(self.frames.get(i, b"") for i in range(count))
+        feedback = self.covert_channel.ack_bitmap(self.frames, count)
+        for _ in range(3):
+            self.sock.sendto(feedback, address)
+        return b"".join(self.frames[i] for i in range(count))
+
+    def decode_framed(self, data):
+        """
+        Decodes the coded bytes of the framed mode with the `HuffmanCode` up to the unescaped stopping character, keeping it and the escape characters.
+        """
+        stopping_byte = ord(self.stopping_character)
+        escape_byte = ord(self.escape_character) if self.escape_character is not None else None
+        self.decoded = bytearray()
+        escaped = False
+        for byte in self.coder.decode(data):
+            self.decoded.append(byte)
+            if escaped:
+                escaped = False
+            elif byte == escape_byte:
+                escaped = True
+            elif byte == stopping_byte:
+                break
+        return bytes(self.decoded)
+
+    def write_framed(self, data):
+        """
+        Writes the payload of the framed mode to the sink, a callable that takes bytes or a file path.
+        """
+        if callable(self.sink):
+            self.sink(data)
+        else:
+            with open(self.sink, "wb") as sink_file:
+                sink_file.write(data)
+
+    def receive_stream(self):
+        """
+        - Receives the covert message and writes the decoded payload to the sink in chunks of `chunk_size` bytes while it is received.
+        - The sink is a callable that takes bytes, or a file path that is written through a `CheckpointSink`:
+          the file is synced every `flush_interval` ms, and the bytes on disk are recorded in the `checkpoint` file if one is given.
+        - With `resume`, the file is kept up to the offset of the checkpoint and the message is appended to it.
+          The sender has to be started with that offset as its `resume_offset`.
+        - The decoded bytes are not kept in memory, so memory stays flat for any payload size.
+        """
+        if callable(self.sink):
+            self.write_stream(self.sink)
+            return
+        with CheckpointSink(self.sink, self.chunk_size, self.flush_interval, self.checkpoint, self.resume, self.clock) as sink:
+            append = sink.append
+            for byte in self.decode_bytes():
+                append(byte)
+            sink.complete()
+
+    def write_stream(self, write):
+        """
+        Groups the decoded bytes into chunks and passes every chunk to `write`.
+        """
+        chunk = bytearray()
+        for byte in self.decode_bytes():
+            chunk.append(byte)
+            if len(chunk) >= self.chunk_size:
+                write(bytes(chunk))
+                chunk.clear()
+        if chunk:
+            write(bytes(chunk))
 
 class Sender:
     sock: socket.socket
@@ -265,6 +2287,10 @@ class Sender:
     """
     Keys are the signals and values are the burst sizes, e.g. {'0'= 4, '1'= 3}
     """
+    frame: bytes
+    """
+    Pre-serialized packet used by the fast send engine, built once per run.
+    """
     def __init__(self, covert_channel, params):
         """
         Initializes a Sender object with the given parameters.
@@ -279,14 +2305,42 @@ class Sender:
             - send_dump_data: The data to be sent in each burst.
             - shared_secret: The shared secret used for the covert channel.
             - burst_max: The maximum number of packets in a burst.
+            - send_engine: "scapy" (default) sends every packet through `CovertChannelBase.send`, "raw", "udp" or "gso" use the fast send engine of the covert channel.
+            - symbol_bits: The number of bits carried by one burst, 1 by default.
+            - symbol_spacing: The minimum distance between two burst sizes of the table, 1 by default.
+            - calibration_probes: The number of probe bursts sent by `calibrate` before the burst sizes, 0 (no calibration) by default.
+            - calibration_port: The local port the calibration reply is received on, port + 1 by default.
+            - calibration_timeout: How long to wait for the calibration reply in milliseconds, 2000 by default.
+            - payload: The data to send instead of a random message, a file path, a bytes object or an iterator of byte chunks.
+            - stopping_character: The character appended to the payload to end the message, "." by default.
+            - escape_character: The character used to escape stopping and escape characters inside the payload, none by default.
+            - chunk_size: The number of bytes read from a payload file at a time, 65536 by default.
+            - fec: The forward error correction of every byte, None (default) or "hamming".
+            - clock: Object with `time()`, `monotonic()` and `sleep()`, the `time` module by default. Used to run the sender on a simulated clock.
+            - socket_factory: Creates the sockets of the sender, `socket.socket` by default.
+            - metrics: The JSON file the metrics of the run are written to, none (disabled) by default.
+            - profile: The file the cProfile statistics of the run are dumped to, none (disabled) by default.
+            - lanes: The number of port lanes the message is striped across, 1 by default.
+            - frame_size: The number of message bytes per frame in the framed mode (1 to 255), none (not framed) by default.
+            - pacer: How the gap after a burst is waited, "deadline" (default) or "sleep", see `BurstPacer`.
+            - pacer_spin: The time in milliseconds the "deadline" pacer spins before the deadline instead of sleeping, 1 by default.
+            - gap_bits: The number of bits carried by the gap before every data burst, next to the burst size, 0 (off) by default.
+            - gap_step: The difference in milliseconds between two gap classes, added to `delay_between_bursts`, 20 by default.
+            - arq: Whether the framed mode resends the frames the receiver reports as missing, False by default, see `send_reliable`.
+            - arq_timeout: The time in milliseconds to wait for the feedback of the receiver after a round end burst, 500 by default.
+            - arq_rounds: The largest number of rounds, the first one included, 8 by default.
+            - coding: How the message is coded before it is sent, none (default) or "huffman", see `HuffmanCode`.
+            - coding_corpus: A sample file the Huffman code is built from, none (default) for the character distribution of `generate_random_message`.
+            - resume_offset: The number of payload bytes the receiver already has, they are skipped, 0 by default. See `Receiver.receive_stream`.
         """
         self.covert_channel = covert_channel
         
         self.log_file_name = params['log_file_name']
         self.ip = params['ip']
         self.port = params['port']
-        self.signal_order = params['signal_order']
-        self.signal_order = [str(v) for v in self.signal_order]
+        self.symbol_bits = params.get('symbol_bits', 1)
+        self.symbol_spacing = params.get('symbol_spacing', 1)
+        self.signal_order = self.covert_channel.symbol_signals(params['signal_order'], self.symbol_bits)
         self.delay_between_bursts = params['delay_between_bursts']
         self.send_dump_data = params['send_dump_data']
         if isinstance(self.send_dump_data, str):
@@ -294,6 +2348,37 @@ class Sender:
         self.shared_secret = params['shared_secret']
         self.burst_max = params['burst_max']
         self.history_size = params['history_size']
+        self.send_engine = params.get('send_engine', 'scapy')
+        self.calibration_probes = params.get('calibration_probes', 0)
+        self.calibration_port = params.get('calibration_port', self.port + params.get('lanes', 1))
+        self.calibration_timeout = params.get('calibration_timeout', 2000)
+        self.payload = params.get('payload', None)
+        self.stopping_character = params.get('stopping_character', '.')
+        self.escape_character = params.get('escape_character', None)
+        self.chunk_size = params.get('chunk_size', 65536)
+        self.fec = params.get('fec', None)
+        self.clock = params.get('clock', time)
+        self.socket_factory = params.get('socket_factory', socket.socket)
+        self.metrics_file_name = params.get('metrics', None)
+        self.metrics = Metrics("sender", self.burst_max) if self.metrics_file_name is not None else None
+        self.profile = params.get('profile', None)
+        self.lanes = params.get('lanes', 1)
+        self.frame_size = params.get('frame_size', None)
+        self.pacer = BurstPacer(self.clock, params.get('pacer', 'deadline'), self.covert_channel.to_sec(params.get('pacer_spin', 1)))
+        self.gap_bits = params.get('gap_bits', 0)
+        self.gap_step = params.get('gap_step', 20)
+        self.gap_order = self.covert_channel.gap_signals(self.shared_secret, self.gap_bits) if self.gap_bits else []
+        self.arq = params.get('arq', False)
+        self.arq_timeout = params.get('arq_timeout', 500)
+        self.arq_rounds = params.get('arq_rounds', 8)
+        self.retransmitted_frames = 0
+        self.delivered = None
+        self.coding = params.get('coding', None)
+        self.coder = self.covert_channel.payload_code(self.coding, params.get('coding_corpus', None), self.stopping_character)
+        self.resume_offset = params.get('resume_offset', 0)
+        if self.metrics is not None:
+            self.metrics.pacer = self.pacer
+        self.params = params
 
     def run(self):
 
@@ -301,14 +2386,107 @@ class Sender:
         Starts the sender. It creates a socket, generates the burst sizes using the
         shared secret and the timestamp, sends the predefined burst sizes, and sends
         the main data. It then closes the socket.
+        If a fast send engine is selected, its socket stays open for the whole run.
+        If `calibration_probes` is set, the link is calibrated before the burst sizes are sent.
+        If `metrics` is set, the metrics of the run are written to that JSON file at the end, and if `profile` is set the run is profiled.
+        With more than one lane it runs the striped sender, see `run_lanes`.
+        A bytes payload is checked with `check_payload` first, so a payload that cannot be sent fails before any burst is sent.
 
         """
+        if self.payload is not None:
+            self.covert_channel.check_payload(self.payload, self.stopping_character, self.escape_character)
+        if self.lanes > 1:
+            self.run_lanes()
+            return
+        profiler = self.covert_channel.start_profiler(self.profile)
+        phase = self.covert_channel.phase
         self.sock = self.create_socket()
-        self.generate_hash_based_burst_size()
-        self.send_burst_sizes()
-        self.send_main_data()
+        if self.send_engine != "scapy":
+            self.covert_channel.open_send_engine(self.ip, self.port, self.send_engine, self.socket_factory)
+            self.frame = self.covert_channel.build_udp_frame(self.ip, self.port, self.send_dump_data, self.send_engine)
+        try:
+            if self.calibration_probes:
+                with phase(self.metrics, "calibrate"):
+                    self.calibrate()
+            with phase(self.metrics, "generate_hash_based_burst_size"):
+                self.generate_hash_based_burst_size()
+            if self.frame_size is None:
+                # In the framed mode the burst table is sent at the start of every frame
+                with phase(self.metrics, "send_burst_sizes"):
+                    self.send_burst_sizes()
+                    if self.gap_bits:
+                        self.send_gap_classes()
+            if self.payload is not None:
+                with phase(self.metrics, "send_payload"):
+                    self.send_payload()
+            else:
+                with phase(self.metrics, "send_main_data"):
+                    self.send_main_data()
+        finally:
+            self.covert_channel.close_send_engine()
+            self.sock.close()
+            self.covert_channel.stop_profiler(profiler, self.profile)
+            if self.metrics is not None:
+                self.metrics.write(self.metrics_file_name)
 
-        self.sock.close()
+    def run_lanes(self):
+        """
+        - Runs the striped sender: the message is split into one stripe per lane, byte i goes to lane i % `lanes`.
+        - Every lane is a `Sender` with its own port, burst table and socket, see `MyCovertChannel.lane_params`, running in its own thread.
+        - Every stripe ends with its own stopping character, so each lane is a complete message for its receiver lane.
+        - The payload is read into memory to split it. Without a payload the random message is generated and logged as in the single lane mode.
+        """
+        if self.payload is not None:
+            data = b"".join(self.covert_channel.payload_chunks(self.payload, self.chunk_size))
+        else:
+            message = self.covert_channel.generate_random_binary_message_with_logging(
+                log_file_name=self.log_file_name,
+                min_length=16,
+                max_length=16
+            )
+            # The stopping character is sent at the end of every stripe
+            data = bytes(int(message[i:i+8], 2) for i in range(0, len(message) - 8, 8))
+        senders = []
+        for lane, stripe in enumerate(self.covert_channel.split_stripes(data, self.lanes)):
+            lane_params = self.covert_channel.lane_params(self.params, lane, self.lanes)
+            lane_params['payload'] = stripe
+            senders.append(Sender(type(self.covert_channel)(), lane_params))
+        threads = [threading.Thread(target=sender.run) for sender in senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def calibrate(self):
+        """
+        - Sends `calibration_probes` probe bursts of `burst_max` packets with the configured delay, see `Receiver.calibrate`.
+        - Waits for the delays chosen by the receiver on `calibration_port` and uses its `delay_between_bursts` for the rest of the run.
+        - If no reply arrives within `calibration_timeout`, the configured delay is kept.
+        - The outcome is logged so the run can be reproduced with the same delays.
+        """
+        self.sock.bind(("", self.calibration_port))
+        self.sock.settimeout(self.covert_channel.to_sec(self.calibration_timeout))
+        configured = self.delay_between_bursts
+        for _ in range(self.calibration_probes):
+            self.send_burst(self.burst_max)
+        chosen = None
+        try:
+            data, _ = self.sock.recvfrom(1024)
+            chosen = json.loads(data)
+            if chosen["delay_between_bursts"] is not None:
+                self.delay_between_bursts = chosen["delay_between_bursts"]
+        except (socket.timeout, ValueError, KeyError) as e:
+            print(f"ERROR: Calibration failed, keeping the configured delay: {e}")
+        calibration = {
+            "probes": self.calibration_probes,
+            "configured": {"delay_between_bursts": configured},
+            "chosen": chosen,
+            "delay_between_bursts": self.delay_between_bursts,
+        }
+        self.covert_channel.log_message(
+            json.dumps(calibration, indent=2),
+            self.covert_channel.calibration_log_file_name(self.log_file_name)
+            )
 
     def generate_hash_based_burst_size(self):
 
@@ -317,17 +2495,21 @@ class Sender:
         The burst sizes are generated as follows:
         - The current timestamp and the shared secret are concatenated and hashed with SHA-256.
         - The resulting hash is split into 8 byte chunks, and each chunk is converted to an integer and reduced modulo self.burst_max.
-        - The resulting list of integers is used as the burst sizes.
-        - If there are any duplicate burst sizes, the process is repeated with the previous hash as input until a set of unique burst sizes is generated.
+        - One more size than the number of signals is generated, e.g. 3 sizes for 1 bit per burst and 5 sizes for 2 bits per burst.
+        - The resulting list of integers is used as the burst sizes, a size that is a duplicate of (or closer than `symbol_spacing` to) an earlier one is moved to the next free size.
+        - If the sizes cannot be placed, the process is repeated with the previous hash as input.
         """
-        timestamp = int(time.time())
+        count = len(self.signal_order) + 1
+        if count * self.symbol_spacing > self.burst_max:
+            raise ValueError(f"burst_max must be at least {count * self.symbol_spacing} for {self.symbol_bits} bits per burst with spacing {self.symbol_spacing}")
+        timestamp = int(self.clock.time())
         input_data = f"{timestamp}{self.shared_secret}".encode()
         hashed = hashlib.sha256(input_data).hexdigest()
-        sizes = [(int(hashed[i:i+8], 16) % self.burst_max) + 1 for i in range(0, 24, 8)]
+        sizes = self.covert_channel.place_burst_sizes(self.covert_channel.hash_chunks(hashed, count), self.burst_max, self.symbol_spacing)
 
-        while len(set(sizes)) != len(sizes):
+        while sizes is None:
             hashed = hashlib.sha256(hashed.encode()).hexdigest()
-            sizes = [(int(hashed[i:i+8], 16) % self.burst_max) + 1 for i in range(0, 24, 8)]
+            sizes = self.covert_channel.place_burst_sizes(self.covert_channel.hash_chunks(hashed, count), self.burst_max, self.symbol_spacing)
 
         self.signal_to_burstsize = {k: v for k, v in zip(self.signal_order, sizes)}
         # print(f"DEBUG: Generated signal_to_burstsize: {self.signal_to_burstsize}")
@@ -336,7 +2518,7 @@ class Sender:
         """
         Creates a UDP socket to be used for sending packets.
         """
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock = self.socket_factory(socket.AF_INET, socket.SOCK_DGRAM)
         return sock
     
     def createUDPPacket(self, ip, port, data):
@@ -347,7 +2529,10 @@ class Sender:
         ip (str): Destination IP address.
         port (int): Destination port.
         data (bytes): Payload of the packet.
+
+        scapy is only needed by the scapy send path, so it is imported here and not when the module is loaded.
         """
+        from scapy.all import IP, UDP, Raw
         return IP(dst=ip) / UDP(dport=port) / Raw(data)
 
     def send_burst(self, burst_size):
@@ -358,12 +2543,21 @@ class Sender:
         burst_size (int): The number of packets in the burst.
 
         The function sends a burst of packets with the payload specified in `send_dump_data` to the IP address and port specified in `ip` and `port` respectively.
-        The delay between packets is specified in `delay_between_bursts`.
+        The delay between bursts is specified in `delay_between_bursts` and waited by the `pacer`.
+        With a fast send engine the whole burst is pushed through the open engine socket with the cached frame.
+        With metrics enabled, the time it takes to push the burst out and the gap since the previous burst are recorded.
         """
-        for _ in range(burst_size):
-            packet = self.createUDPPacket(self.ip, self.port, self.send_dump_data)
-            CovertChannelBase.send(self.covert_channel, packet)
-        time.sleep(self.covert_channel.to_sec(self.delay_between_bursts))
+        if self.metrics is not None:
+            start = time.perf_counter()
+        if self.send_engine == "scapy":
+            for _ in range(burst_size):
+                packet = self.createUDPPacket(self.ip, self.port, self.send_dump_data)
+                CovertChannelBase.send(self.covert_channel, packet)
+        else:
+            self.covert_channel.send_frames(self.frame, burst_size)
+        if self.metrics is not None:
+            self.metrics.burst(burst_size, start, time.perf_counter())
+        self.pacer.wait(self.covert_channel.to_sec(self.delay_between_bursts))
     
     def send_burst_sizes(self):
         """
@@ -372,39 +2566,219 @@ class Sender:
         for size in self.signal_to_burstsize.values():
             self.send_burst(size)
 
+    def send_gap_classes(self):
+        """
+        - Sends one training burst per gap class, the i-th one after a gap of class i, so the receiver can learn the gaps of the classes.
+        - A gap of class i is `delay_between_bursts` + i * `gap_step` milliseconds.
+        """
+        size = next(iter(self.signal_to_burstsize.values()))
+        for gap_class in range(len(self.gap_order)):
+            self.send_gap(gap_class)
+            self.send_burst(size)
+
+    def send_gap(self, gap_class):
+        """
+        Waits the part of a class `gap_class` gap that comes on top of `delay_between_bursts`, which `send_burst` already waited.
+        """
+        if gap_class:
+            self.pacer.wait(self.covert_channel.to_sec(gap_class * self.gap_step))
+
     def send_main_data(self):
         """
-        Sends a random binary message of length between 5 and 10 over the covert channel.
-        The message is first logged to a file, then sent over the channel by converting the binary message to a string and sending each character as a burst of packets with a size corresponding to the signal order.
-        The burst sizes are updated every 8 characters using the regenerate_burst_sizes method of the covert channel object.
+        Sends a random message of 16 characters over the covert channel.
+        The message is first logged to a file, then converted to bytes and sent with `send_message_bytes`.
         """
         message = self.covert_channel.generate_random_binary_message_with_logging(
             log_file_name=self.log_file_name,
             min_length=16,
             max_length=16
         )
-        message_str = self.covert_channel.convert_binary_message_to_string(message)
-        # print(f"DEBUG: Sending main data: \n{message}\nString: {message_str}")
-        byte_clock = 0
-        start_time = time.time()
-        for index, signal in enumerate(message):
-            size = self.signal_to_burstsize[signal]
+        message_bytes = bytes(int(message[i:i+8], 2) for i in range(0, len(message), 8))
+        # print(f"DEBUG: Sending main data: \n{message}\nBytes: {message_bytes}")
+        # The time taken is recorded as the send_main_data phase when metrics are enabled
+        self.send_message_bytes(message_bytes)
+
+    def send_message_bytes(self, data):
+        """
+        Sends the given bytes over the covert channel, each byte as a series of bursts with sizes corresponding to the signal order.
+        Every byte is split into symbols of `symbol_bits` bits, the last symbol is padded with zeros if 8 is not a multiple of `symbol_bits`.
+        With a FEC, the symbols carry the coded bits of every byte.
+        The burst sizes are updated after every byte through the rolling `CodecState`, so the cost per byte does not depend on the message length.
+        The data can be any iterable of byte values, it is consumed lazily.
+        With a `frame_size`, the data is sent in frames with `send_framed`, or with `send_reliable` if `arq` is set.
+        With a `coding`, the data is coded with the `HuffmanCode` first.
+        With `gap_bits`, every burst is sent after a gap of the class given by `encode_symbols`.
+        """
+        if self.coder is not None:
+            data = self.coded_bytes(data)
+        if self.frame_size is not None:
+            if self.arq:
+                self.send_reliable(data)
+            else:
+                self.send_framed(data)
+            return
+        if self.gap_bits:
+            for gap_class, size in self.encode_symbols(data):
+                self.send_gap(gap_class)
+                self.send_burst(size)
+            return
+        for size in self.encode_bursts(data):
             self.send_burst(size)
-            if index == len(message) - 1:
-                end_time = time.time()
-                total_time = end_time - start_time
-                # print(f"DEBUG: Time taken to send main data: {total_time}")
-            byte_clock += 1
-            if byte_clock == 8:
-                byte_clock = 0
-                byte_index = index // 8
-                hist = message_str[:byte_index+1]
-                burst_sizes = self.covert_channel.regenerate_burst_sizes(
-                    list(self.signal_to_burstsize.values()),
-                    hist,
-                    self.burst_max,
-                    self.history_size
-                )
-                self.signal_to_burstsize = {k: v for k, v in zip(self.signal_order, burst_sizes)}
-                # print(f"DEBUG: Updated burst sizes: {self.signal_to_burstsize} using hist: {hist}")
-                # input("Press enter to continue...")
\ No newline at end of file
+
+    def coded_bytes(self, data):
+        """
+        Generator that codes the data with the `HuffmanCode` and adds the source bytes and the code word bits to the metrics at the end.
+        """
+        yield from self.coder.encode(data)
+        if self.metrics is not None:
+            self.metrics.counters["source_bytes"] = self.coder.source_bytes
+            self.metrics.counters["coded_bits"] = self.coder.coded_bits
+
+    def send_framed(self, data):
+        """
+        - Sends the data in frames of `frame_size` bytes, see `MyCovertChannel.frame_bytes`.
+        - Every frame starts with a sync burst of `burst_max` + 2 packets and the initial burst table, and its history starts empty,
+          so the receiver can lock on any frame.
+        - The last frame is shorter than `frame_size`, an empty frame is sent if the data ends on a frame boundary.
+        - The frames are cut with `frame_chunks` before the first one is sent, so a message that needs too many frames is rejected up front.
+        - Gap classes are not supported in the framed mode.
+        """
+        if self.gap_bits:
+            raise ValueError("gap_bits is not supported in the framed mode")
+        initial_table = dict(self.signal_to_burstsize)
+        for index, chunk in enumerate(self.frame_chunks(data)):
+            self.send_frame(index, chunk, initial_table)
+
+    def frame_chunks(self, data):
+        """
+        - Cuts the data into the chunks of the frames, the last one shorter than `frame_size`.
+        - Raises ValueError before anything is sent if the data needs more than 65536 frames, since the frame index has 16 bits.
+          At most that many frames are read, so the check keeps memory bounded for any payload.
+        """
+        data = iter(data)
+        chunks = []
+        while len(chunks) < 0x10000:
+            chunks.append(bytes(itertools.islice(data, self.frame_size)))
+            if len(chunks[-1]) < self.frame_size:
+                return chunks
+        raise ValueError(f"The framed mode supports at most {0x10000} frames ({0x10000 * self.frame_size - 1} bytes with frame_size {self.frame_size})")
+
+    def send_frame(self, index, chunk, initial_table):
+        """
+        Sends one frame: the sync burst, the initial burst table and the frame bytes, encoded with a history that starts empty.
+        """
+        self.send_burst(self.burst_max + 2)
+        self.signal_to_burstsize = dict(initial_table)
+        self.send_burst_sizes()
+        for size in self.encode_bursts(self.covert_channel.frame_bytes(index, chunk)):
+            self.send_burst(size)
+
+    def send_reliable(self, data):
+        """
+        - Sends the data in frames as `send_framed` does, in rounds. Every round ends with a round end burst of `burst_max` + 4 packets,
+          which the receiver answers with the frames it has, see `Receiver.receive_reliable`.
+        - The next round sends only the frames that were not acknowledged. A frame starts from the initial table with an empty history,
+          so a frame that is sent again has the same burst sizes as the first time.
+        - The feedback is received on `calibration_port`. If none arrives within `arq_timeout`, the round end burst is sent again, up to 3 times.
+        - Gives up with an error after `arq_rounds` rounds, or when the receiver does not answer. `delivered` tells whether every frame was acknowledged.
+        - The frames are kept in memory to be sent again, and at most 65536 frames can be told apart.
+        """
+        if self.gap_bits:
+            raise ValueError("gap_bits is not supported in the framed mode")
+        initial_table = dict(self.signal_to_burstsize)
+        chunks = self.frame_chunks(data)
+        if not self.calibration_probes:
+            self.sock.bind(("", self.calibration_port))
+        pending = range(len(chunks))
+        acked = set()
+        self.delivered = False
+        for round_index in range(self.arq_rounds):
+            if round_index:
+                self.retransmitted_frames += len(pending)
+                if self.metrics is not None:
+                    self.metrics.counters["retransmitted_frames"] = self.retransmitted_frames
+            for index in pending:
+                self.send_frame(index, chunks[index], initial_table)
+            if not self.receive_feedback(acked, len(chunks)):
+                print("ERROR: No feedback from the receiver, giving up")
+                return
+            pending = [index for index in range(len(chunks)) if index not in acked]
+            if not pending:
+                self.delivered = True
+                return
+        print(f"ERROR: {len(pending)} of {len(chunks)} frames were not delivered after {self.arq_rounds} rounds: {pending}")
+
+    def receive_feedback(self, acked, count):
+        """
+        - Adds the frames acknowledged by the receiver to the set `acked`, returns False if the receiver does not answer.
+        - Feedback that is already waiting is read first. Frames are never lost once received, so every bitmap can be added to `acked`.
+          If it already covers all `count` frames, the receiver has sent its final feedback and no round end burst is needed.
+        - Otherwise the round end burst is sent and the feedback waited for `arq_timeout`, up to 3 times.
+        """
+        acked_frames = self.covert_channel.acked_frames
+        self.sock.setblocking(False)
+        try:
+            while True:
+                feedback, _ = self.sock.recvfrom(65535)
+                acked |= acked_frames(feedback)
+        except BlockingIOError:
+            pass
+        except ValueError as e:
+            print(f"ERROR: Invalid feedback from the receiver: {e}")
+        if len(acked) >= count:
+            return True
+        self.sock.settimeout(self.covert_channel.to_sec(self.arq_timeout))
+        for _ in range(3):
+            self.send_burst(self.burst_max + 4)
+            try:
+                feedback, _ = self.sock.recvfrom(65535)
+                acked |= acked_frames(feedback)
+                return True
+            except socket.timeout:
+                pass
+            except ValueError as e:
+                print(f"ERROR: Invalid feedback from the receiver: {e}")
+        return False
+
+    def encode_bursts(self, data):
+        """
+        Generator that turns bytes into symbols and symbols into burst sizes, regenerating the burst sizes after every byte.
+        """
+        self.codec = CodecState(self.covert_channel, list(self.signal_to_burstsize.values()), self.burst_max, self.history_size, keep_output=False)
+        byte_symbols = self.covert_channel.byte_symbol_table(self.symbol_bits, self.fec)
+        metrics = self.metrics
+        for byte in data:
+            if metrics is not None:
+                metrics.counters["bytes"] += 1
+            for signal in byte_symbols[byte]:
+                yield self.signal_to_burstsize[signal]
+            burst_sizes = self.codec.push(byte)
+            self.signal_to_burstsize = {k: v for k, v in zip(self.signal_order, burst_sizes)}
+            # print(f"DEBUG: Updated burst sizes: {self.signal_to_burstsize}")
+
+    def encode_symbols(self, data):
+        """
+        - Generator that turns bytes into (gap class, burst size) pairs for the `gap_bits` mode, regenerating the burst sizes after every byte.
+        - Every symbol has `gap_bits` + `symbol_bits` bits, the first `gap_bits` select the gap class and the rest the burst size.
+        """
+        self.codec = CodecState(self.covert_channel, list(self.signal_to_burstsize.values()), self.burst_max, self.history_size, keep_output=False)
+        byte_symbols = self.covert_channel.byte_symbol_table(self.symbol_bits + self.gap_bits, self.fec)
+        gap_classes = {signal: gap_class for gap_class, signal in enumerate(self.gap_order)}
+        gap_bits = self.gap_bits
+        metrics = self.metrics
+        for byte in data:
+            if metrics is not None:
+                metrics.counters["bytes"] += 1
+            for signal in byte_symbols[byte]:
+                yield gap_classes[signal[:gap_bits]], self.signal_to_burstsize[signal[gap_bits:]]
+            burst_sizes = self.codec.push(byte)
+            self.signal_to_burstsize = {k: v for k, v in zip(self.signal_order, burst_sizes)}
+
+    def send_payload(self):
+        """
+        - Sends the `payload` parameter through the lazy pipeline: chunks -> escaped bytes -> symbols -> burst sizes -> bursts.
+        - A payload file is read `chunk_size` bytes at a time while the bursts are sent, so memory stays flat for any payload size.
+        - The first `resume_offset` bytes are skipped, so a receiver that resumes from a checkpoint gets the rest as a new message.
+        """
+        chunks = self.covert_channel.payload_chunks(self.payload, self.chunk_size, self.resume_offset)
+        self.send_message_bytes(self.covert_channel.stuff_bytes(chunks, self.stopping_character, self.escape_character))
@@ -0,0 +1,1325 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from MyCovertChannel import BurstPacer, BurstSegmenter, MyCovertChannel, PacketRing, Receiver, Sender
+from CovertChannelBase import CovertChannelBase
+from simulator import SimNetwork, run_simulation, simulate
+
+
+def sender_params(ip, port, send_engine, log_file_name="benchmark_sender.log", **overrides):
+    """
+    Returns the example sender parameters, pointed at the given ip and port.
+    """
+    params = {
+        "log_file_name": log_file_name,
+        "ip": ip,
+        "port": port,
+        "signal_order": [1, 0],
+        "send_dump_data": "0b00000001",
+        "shared_secret": "secret",
+        "delay_between_bursts": 0,
+        "burst_max": 3,
+        "history_size": 4,
+        "send_engine": send_engine,
+    }
+    params.update(overrides)
+    return params
+
+
+def make_sender(covert_channel, ip, port, send_engine, log_file_name="benchmark_sender.log", **overrides):
+    """
+    Creates a Sender with the example parameters, pointed at the given ip and port.
+    """
+    return Sender(covert_channel, sender_params(ip, port, send_engine, log_file_name, **overrides))
+
+
+def receiver_params(ip, port, log_file_name="benchmark_receiver.log", **overrides):
+    """
+    Returns the example receiver parameters, bound to the given ip and port.
+    """
+    params = {
+        "log_file_name": log_file_name,
+        "ip": ip,
+        "port": port,
+        "signal_order": [1, 0],
+        "stopping_character": ".",
+        "shared_secret": "secret",
+        "delay_waiting_for_burst": 50,
+        "socket_awakening_delay": 30,
+        "burst_max": 3,
+        "history_size": 4,
+    }
+    params.update(overrides)
+    return params
+
+
+def make_receiver(covert_channel, ip, port, log_file_name="benchmark_receiver.log", **overrides):
+    """
+    Creates a Receiver with the example parameters, bound to the given ip and port.
+    """
+    return Receiver(covert_channel, receiver_params(ip, port, log_file_name, **overrides))
+
+
+def run_channel(ip, port, sender_overrides, receiver_overrides, timeout=120):
+    """
+    - Runs one receiver and one sender over the given address and compares the two log files.
+    - Returns (correct, sender wall time in seconds, number of message bits).
+    """
+    log_dir = tempfile.mkdtemp(prefix="covert_run_")
+    receiver = make_receiver(MyCovertChannel(), ip, port, os.path.join(log_dir, "receiver.log"), **receiver_overrides)
+    sender = make_sender(MyCovertChannel(), ip, port, sender_overrides.pop("send_engine", "udp"), os.path.join(log_dir, "sender.log"), **sender_overrides)
+    receiver_thread = threading.Thread(target=receiver.run)
+    receiver_thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    sender.run()
+    elapsed = time.perf_counter() - start
+    receiver_thread.join(timeout=timeout)
+    with open(sender.log_file_name) as log_file:
+        sent = log_file.read()
+    received = None
+    if os.path.exists(receiver.log_file_name):
+        with open(receiver.log_file_name) as log_file:
+            received = log_file.read()
+    return sent == received, elapsed, len(sent) * 8
+
+
+def bench_send(args):
+    """
+    - Compares the packets per second of the scapy send path against the fast send engines.
+    - The scapy path builds a packet with `createUDPPacket` and sends it with `CovertChannelBase.send` for every packet.
+    - The engines build the frame once and push whole bursts through one open socket.
+    """
+    results = {}
+    for engine in args.engines:
+        covert_channel = MyCovertChannel()
+        sender = make_sender(covert_channel, args.ip, args.port, engine)
+        packets = args.scapy_packets if engine == "scapy" else args.packets
+        if engine == "scapy":
+            # scapy is imported on the first packet, keep the import out of the measurement
+            sender.createUDPPacket(sender.ip, sender.port, sender.send_dump_data)
+        start = time.perf_counter()
+        if engine == "scapy":
+            for _ in range(packets):
+                packet = sender.createUDPPacket(sender.ip, sender.port, sender.send_dump_data)
+                CovertChannelBase.send(covert_channel, packet, interface=args.interface)
+        else:
+            covert_channel.open_send_engine(sender.ip, sender.port, engine)
+            frame = covert_channel.build_udp_frame(sender.ip, sender.port, sender.send_dump_data, engine)
+            for _ in range(packets // args.burst_size):
+                covert_channel.send_frames(frame, args.burst_size)
+            covert_channel.close_send_engine()
+            packets = (packets // args.burst_size) * args.burst_size
+        elapsed = time.perf_counter() - start
+        results[engine] = packets / elapsed
+        print(f"{engine:>6}: {packets} packets in {elapsed:.3f}s -> {results[engine]:.0f} packets/s")
+    if "scapy" in results:
+        for engine, pps in results.items():
+            if engine != "scapy":
+                print(f"{engine:>6}: {pps / results['scapy']:.1f}x the scapy path")
+    return results
+
+
+def bench_sessions(args):
+    """
+    - Drives N senders over loopback against one multi-session receiver and reports the aggregate decoded bits per second.
+    - Every sender runs in its own thread with the "udp" send engine, so each one has a distinct source port.
+    - A session is counted as correct if its decoded message is one of the logged sent messages.
+    """
+    log_dir = tempfile.mkdtemp(prefix="covert_sessions_")
+    receiver = make_receiver(
+        MyCovertChannel(), args.ip, args.port, os.path.join(log_dir, "receiver.log"),
+        receive_engine="sessions", session_limit=args.senders
+        )
+    receiver_thread = threading.Thread(target=receiver.run)
+    receiver_thread.start()
+    time.sleep(0.5)
+
+    senders = [
+        make_sender(
+            MyCovertChannel(), args.ip, args.port, "udp", os.path.join(log_dir, f"sender_{index}.log"),
+            delay_between_bursts=args.delay_between_bursts
+            )
+        for index in range(args.senders)
+        ]
+    threads = [threading.Thread(target=sender.run) for sender in senders]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        time.sleep(args.stagger / 1000)
+    for thread in threads:
+        thread.join()
+    receiver_thread.join(timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+
+    sent = []
+    for sender in senders:
+        with open(sender.log_file_name) as log_file:
+            sent.append(log_file.read())
+    correct = 0
+    decoded_bits = 0
+    for _, data, success in receiver.finished_sessions:
+        if success and data in sent:
+            sent.remove(data)
+            correct += 1
+            decoded_bits += len(data) * 8
+    print(f"senders: {args.senders}, finished sessions: {len(receiver.finished_sessions)}, correct: {correct}")
+    print(f"wall time: {elapsed:.2f}s, aggregate decoded rate: {decoded_bits / elapsed:.1f} bits/s")
+    print(f"session logs: {log_dir}")
+    return decoded_bits / elapsed
+
+
+def bench_symbols(args):
+    """
+    - Measures the throughput of the channel for different numbers of bits per burst over loopback.
+    - All runs use the same `burst_max`, `symbol_spacing` and delays, only `symbol_bits` changes.
+    - The expected rate is 8 bits per ceil(8 / k) bursts of `delay_between_bursts`, ignoring the burst table.
+    """
+    delays = {"delay_waiting_for_burst": args.delay_waiting_for_burst, "socket_awakening_delay": args.socket_awakening_delay}
+    results = {}
+    for symbol_bits in args.symbol_bits:
+        needed = (2 ** symbol_bits + 1) * args.symbol_spacing
+        if needed > args.burst_max:
+            print(f"k={symbol_bits}: skipped, burst_max must be at least {needed}")
+            continue
+        symbols = {"symbol_bits": symbol_bits, "symbol_spacing": args.symbol_spacing, "burst_max": args.burst_max}
+        correct, elapsed, bits = run_channel(
+            args.ip, args.port,
+            dict(symbols, delay_between_bursts=args.delay_between_bursts),
+            dict(symbols, **delays)
+            )
+        expected = 8 / (-(-8 // symbol_bits) * args.delay_between_bursts / 1000)
+        results[symbol_bits] = bits / elapsed
+        print(f"k={symbol_bits}: {'correct' if correct else 'WRONG'}, {bits} bits in {elapsed:.2f}s -> {bits / elapsed:.2f} bits/s (expected {expected:.2f} bits/s)")
+    return results
+
+
+def encode_offline(sender, payload):
+    """
+    - Runs the payload through `Sender.send_message_bytes` without sockets, collecting the burst sizes in an array.
+    - Returns the burst sizes and the initial burst table of the receiver, keys are burst sizes, values are signals.
+    """
+    sender.generate_hash_based_burst_size()
+    table = {size: signal for signal, size in sender.signal_to_burstsize.items()}
+    burst_sizes = array("B")
+    sender.send_burst = burst_sizes.append
+    sender.send_message_bytes(payload)
+    return burst_sizes, table
+
+
+def offline_burst_stream(burst_sizes):
+    """
+    - Yields the burst sizes, then raises EOFError.
+    - The receiver reads the stream inside its own generators, where a StopIteration at the end would become a RuntimeError (PEP 479).
+    """
+    yield from burst_sizes
+    raise EOFError("No more burst sizes")
+
+
+def decode_offline(receiver, table, burst_sizes):
+    """
+    - Runs burst sizes through `Receiver.receive_main_data` without sockets.
+    - Returns the decoded bytes, which are cut short if the receiver fails on an unknown burst size or the burst sizes end before the stopping character.
+    """
+    receiver.burstsizes_to_signal = dict(table)
+    receiver.receive_engine = "segmenter"
+    receiver.burst_stream = offline_burst_stream(burst_sizes)
+    try:
+        return receiver.receive_main_data().encode("latin-1")
+    except (KeyError, EOFError):
+        return bytes(receiver.codec.output)
+
+
+def random_payload(size, stopping_character):
+    """
+    Returns `size` random bytes that end with the stopping character and do not contain it anywhere else.
+    """
+    alphabet = [byte for byte in range(256) if byte != ord(stopping_character)]
+    return bytes(random.choice(alphabet) for _ in range(size - 1)) + stopping_character.encode()
+
+
+def random_messages(count, size, seed, stopping_character):
+    """
+    - Returns `count` messages of `size` random printable bytes without the stopping character, to be sent as the sender payload.
+    - The same seed gives the same messages.
+    """
+    alphabet = [byte for byte in range(32, 127) if byte != ord(stopping_character)]
+    rng = random.Random(seed)
+    return [bytes(rng.choice(alphabet) for _ in range(size)) for _ in range(count)]
+
+
+def bench_codec(args):
+    """
+    - Runs messages of growing size through the real encode and decode paths without sockets.
+    - Encoding calls `Sender.send_message_bytes` with `send_burst` replaced by appending the burst size to an array.
+    - Decoding calls `Receiver.receive_main_data` with the burst sizes as the burst stream.
+    - The cost per byte should stay flat from the smallest to the largest message.
+    """
+    results = {}
+    for size in args.sizes:
+        payload = random_payload(size, args.stopping_character)
+
+        sender = make_sender(MyCovertChannel(), args.ip, args.port, "udp", burst_max=args.burst_max, symbol_bits=args.symbol_bits)
+        start = time.perf_counter()
+        burst_sizes, table = encode_offline(sender, payload)
+        encode_time = time.perf_counter() - start
+
+        receiver = make_receiver(
+            MyCovertChannel(), args.ip, args.port, burst_max=args.burst_max, symbol_bits=args.symbol_bits, stopping_character=args.stopping_character
+            )
+        start = time.perf_counter()
+        received = decode_offline(receiver, table, burst_sizes)
+        decode_time = time.perf_counter() - start
+
+        correct = received == payload
+        results[size] = (encode_time / size, decode_time / size)
+        print(f"{size:>9} bytes: {'correct' if correct else 'WRONG'}, encode {encode_time / size * 1e6:.2f} us/byte, decode {decode_time / size * 1e6:.2f} us/byte")
+    return results
+
+
+def bench_fec(args):
+    """
+    - Measures the goodput of the channel against the rate of miscounted bursts, with and without FEC, without sockets.
+    - Every burst is miscounted by one packet (more or less) with the given probability.
+    - Goodput counts the bytes decoded at the right position, over the time the bursts take with `delay_between_bursts`.
+    - The payload and the miscounted bursts are drawn from `--seed`, so a run can be repeated.
+    """
+    random.seed(args.seed)
+    payload = random_payload(args.size, args.stopping_character)
+    print(f"{'fec':>8} {'error rate':>10} {'bursts':>7} {'byte errors':>11} {'goodput bits/s':>14}")
+    results = {}
+    for fec in args.fec:
+        fec = None if fec == "none" else fec
+        for error_rate in args.error_rates:
+            options = {"burst_max": args.burst_max, "symbol_bits": args.symbol_bits, "fec": fec}
+            sender = make_sender(MyCovertChannel(), args.ip, args.port, "udp", **options)
+            burst_sizes, table = encode_offline(sender, payload)
+            for i in range(len(burst_sizes)):
+                if random.random() < error_rate:
+                    burst_sizes[i] = max(1, burst_sizes[i] + random.choice((-1, 1)))
+            receiver = make_receiver(MyCovertChannel(), args.ip, args.port, stopping_character=args.stopping_character, **options)
+            received = decode_offline(receiver, table, burst_sizes)
+            correct = sum(1 for sent, got in zip(payload, received) if sent == got)
+            goodput = correct * 8 / (len(burst_sizes) * args.delay_between_bursts / 1000)
+            results[(fec, error_rate)] = goodput
+            print(f"{str(fec):>8} {error_rate:>10} {len(burst_sizes):>7} {1 - correct / len(payload):>11.3f} {goodput:>14.2f}")
+    return results
+
+
+def bit_errors(expected, received):
+    """
+    Counts the bit errors of `received` against `expected`. Missing or extra bytes count as 8 bit errors each.
+    """
+    errors = sum(bin(sent ^ got).count("1") for sent, got in zip(expected, received))
+    return errors + 8 * abs(len(expected) - len(received))
+
+
+def run_loopback(ip, port, message, send_params, receive_params, timeout):
+    """
+    - Sends `message` as the sender payload over loopback with the `udp` send engine and decodes it with the segmenter receiver.
+    - Returns (received bytes, sender wall time in seconds, number of packets sent).
+    - A receiver that does not see the stopping character within `timeout` is left behind as a daemon thread,
+      so every point of a sweep should use its own port.
+    """
+    log_dir = tempfile.mkdtemp(prefix="covert_sweep_")
+    send_params = dict(send_params, send_engine="udp", payload=message, log_file_name=os.path.join(log_dir, "sender.log"))
+    receive_params = dict(receive_params, receive_engine="segmenter", log_file_name=os.path.join(log_dir, "receiver.log"))
+    sender = Sender(MyCovertChannel(), send_params)
+    receiver = Receiver(MyCovertChannel(), receive_params)
+    packets = [0]
+    send_burst = sender.send_burst
+
+    def counting_send_burst(burst_size):
+        packets[0] += burst_size
+        send_burst(burst_size)
+    sender.send_burst = counting_send_burst
+
+    receiver_thread = threading.Thread(target=receiver.run, daemon=True)
+    receiver_thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    sender.run()
+    elapsed = time.perf_counter() - start
+    receiver_thread.join(timeout=timeout)
+    received = bytes(receiver.codec.output) if getattr(receiver, "codec", None) is not None else b""
+    return received, elapsed, packets[0]
+
+
+def run_simulated(message, send_params, receive_params, network):
+    """
+    - Sends `message` through `simulator.simulate` on the given `SimNetwork`.
+    - Returns (received bytes, virtual sender time in seconds, number of packets sent).
+    """
+    _, received, duration = simulate(send_params, receive_params, message, network)
+    return received, duration, network.sent
+
+
+def bench_sweep(args):
+    """
+    - Runs the channel over a grid of `burst_max`, `history_size`, the three delays and payload sizes.
+    - `--link loopback` sends real packets over loopback, `--link sim` uses the simulated network of `simulator.py`,
+      where the transfer time is virtual and a point takes milliseconds.
+    - For every point it records the payload bits per second, the bit error rate, the CPU time per packet
+      (sender and receiver together, both run in this process) and the wall time.
+    - Points that cannot work are skipped: `burst_max` below the 3 burst sizes of the table,
+      or `delay_waiting_for_burst` not below `delay_between_bursts`.
+    - The results are written to `--json` and/or `--csv`, one row per point and repeat.
+    """
+    stop = args.stopping_character
+    grid = itertools.product(
+        args.burst_max, args.history_size, args.delay_between_bursts,
+        args.delay_waiting_for_burst, args.socket_awakening_delay, args.payload_sizes
+        )
+    rows = []
+    port = args.port
+    print(f"{'burst_max':>9} {'history':>7} {'between':>7} {'waiting':>7} {'awake':>5} {'bytes':>6} {'bits/s':>8} {'BER':>7} {'us/pkt':>7} {'wall s':>7}")
+    for burst_max, history_size, between, waiting, awakening, size in grid:
+        if burst_max < 3 or waiting >= between:
+            continue
+        for repeat in range(args.repeats):
+            message = random_messages(1, size, f"{args.seed}-{size}-{repeat}", stop)[0]
+            send_params = sender_params(
+                args.ip, port, "udp", burst_max=burst_max, history_size=history_size, delay_between_bursts=between, stopping_character=stop
+                )
+            receive_params = receiver_params(
+                args.ip, port, burst_max=burst_max, history_size=history_size,
+                delay_waiting_for_burst=waiting, socket_awakening_delay=awakening, stopping_character=stop
+                )
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            if args.link == "sim":
+                network = SimNetwork(args.latency, args.jitter, args.loss, seed=args.seed + repeat)
+                received, duration, packets = run_simulated(message, send_params, receive_params, network)
+            else:
+                received, duration, packets = run_loopback(args.ip, port, message, send_params, receive_params, args.timeout)
+                port += 1
+            cpu_time = time.process_time() - cpu_start
+            wall_time = time.perf_counter() - wall_start
+
+            expected = message + stop.encode()
+            row = {
+                "link": args.link,
+                "burst_max": burst_max,
+                "history_size": history_size,
+                "delay_between_bursts": between,
+                "delay_waiting_for_burst": waiting,
+                "socket_awakening_delay": awakening,
+                "payload_bytes": size,
+                "repeat": repeat,
+                "correct": received == expected,
+                "bits_per_second": size * 8 / duration,
+                "bit_error_rate": bit_errors(expected, received) / (len(expected) * 8),
+                "packets": packets,
+                "cpu_us_per_packet": cpu_time / packets * 1e6,
+                "wall_time": wall_time,
+            }
+            rows.append(row)
+            print(f"{burst_max:>9} {history_size:>7} {between:>7} {waiting:>7} {awakening:>5} {size:>6} "
+                  f"{row['bits_per_second']:>8.2f} {row['bit_error_rate']:>7.4f} {row['cpu_us_per_packet']:>7.1f} {wall_time:>7.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+def run_sender_process(ip, port, log_file_name, overrides):
+    """
+    Runs a sender with the `udp` send engine in the current process, target of the sender process of `bench_timestamps`.
+    """
+    make_sender(MyCovertChannel(), ip, port, "udp", log_file_name, **overrides).run()
+
+
+def bench_timestamps(args):
+    """
+    - Compares user and kernel receive timestamps over loopback at tight delays, with busy threads competing for the interpreter.
+    - The sender runs in its own process. The busy threads run next to the receiver and delay its loop like a loaded host would.
+      With user timestamps a delayed read can merge two bursts, with kernel timestamps the bursts are still split at their real arrival times.
+    - Reports the number of correctly decoded runs per mode and the mean delay between arrival and processing.
+    """
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            pass
+    busy_threads = [threading.Thread(target=busy, daemon=True) for _ in range(args.busy_threads)]
+    for thread in busy_threads:
+        thread.start()
+    delays = {"delay_waiting_for_burst": args.delay_waiting_for_burst, "socket_awakening_delay": args.socket_awakening_delay}
+    results = {}
+    port = args.port
+    try:
+        for mode in args.modes:
+            correct = 0
+            arrival_delays = []
+            for _ in range(args.runs):
+                log_dir = tempfile.mkdtemp(prefix="covert_timestamps_")
+                metrics_file = os.path.join(log_dir, "metrics.json")
+                receiver = make_receiver(
+                    MyCovertChannel(), args.ip, port, os.path.join(log_dir, "receiver.log"),
+                    receive_timestamps=mode, metrics=metrics_file, **delays
+                    )
+                receiver_thread = threading.Thread(target=receiver.run, daemon=True)
+                receiver_thread.start()
+                time.sleep(0.2)
+                sender = multiprocessing.Process(
+                    target=run_sender_process,
+                    args=(args.ip, port, os.path.join(log_dir, "sender.log"), {"delay_between_bursts": args.delay_between_bursts})
+                    )
+                sender.start()
+                sender.join()
+                receiver_thread.join(timeout=args.timeout)
+                with open(os.path.join(log_dir, "sender.log")) as log_file:
+                    sent = log_file.read()
+                if os.path.exists(receiver.log_file_name):
+                    with open(receiver.log_file_name) as log_file:
+                        correct += log_file.read() == sent
+                if os.path.exists(metrics_file):
+                    with open(metrics_file) as f:
+                        arrival_delays.append(json.load(f)["histograms"]["arrival_delay"]["mean"])
+                port += 1
+            results[mode] = correct / args.runs
+            arrival_delays = [delay for delay in arrival_delays if delay is not None]
+            delay = f", mean arrival delay {sum(arrival_delays) / len(arrival_delays) * 1e3:.3f} ms" if arrival_delays else ""
+            print(f"{mode:>6}: {correct}/{args.runs} runs correct{delay}")
+    finally:
+        stop.set()
+    return results
+
+
+STARTUP_CHILD = """
+import json, sys
+params = json.loads(sys.argv[1])
+if params.pop("import_scapy"):
+    import scapy.all
+from MyCovertChannel import MyCovertChannel, Sender
+Sender(MyCovertChannel(), params).run()
+"""
+"""
+Sender process of `bench_startup`. With import_scapy it loads scapy before the module, as the module did before scapy was imported lazily.
+"""
+
+
+def bench_startup(args):
+    """
+    - Measures the time from starting a sender process to the arrival of its first packet, over loopback.
+    - The sender uses the `udp` send engine, once as is and once with `scapy.all` imported first, which is what every start cost
+      while `MyCovertChannel` and `CovertChannelBase` imported scapy at module level.
+    - Also reports the time to import `MyCovertChannel` in a fresh process.
+    """
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.ip, args.port))
+    sock.settimeout(args.timeout)
+    results = {}
+    try:
+        for import_scapy in (False, True):
+            params = sender_params(
+                args.ip, args.port, "udp", os.path.join(tempfile.mkdtemp(prefix="covert_startup_"), "sender.log"),
+                delay_between_bursts=0, import_scapy=import_scapy
+                )
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                child = subprocess.Popen([sys.executable, "-c", STARTUP_CHILD, json.dumps(params)], cwd=code_dir)
+                sock.recv(1024)
+                times.append(time.perf_counter() - start)
+                child.wait()
+                sock.setblocking(False)
+                try:
+                    while True:
+                        sock.recv(1024)
+                except BlockingIOError:
+                    pass
+                sock.settimeout(args.timeout)
+            label = "udp, scapy imported" if import_scapy else "udp"
+            results[label] = sorted(times)[len(times) // 2]
+            print(f"{label:>20}: median {results[label] * 1000:.0f} ms from process start to first packet (min {min(times) * 1000:.0f} ms)")
+    finally:
+        sock.close()
+    import_time = subprocess.run(
+        [sys.executable, "-c", "import time; start = time.perf_counter(); import MyCovertChannel; print(time.perf_counter() - start)"],
+        cwd=code_dir, capture_output=True, text=True
+        ).stdout
+    print(f"{'import':>20}: MyCovertChannel imports in {float(import_time) * 1000:.0f} ms")
+    return results
+
+
+def write_synthetic_capture(file_name, args):
+    """
+    - Writes a classic pcap file with `args.sessions` concurrent sessions, each from its own source port, carrying `args.size` random bytes.
+    - Every session is encoded offline with the real `Sender`, its bursts are `args.delay_between_bursts` apart
+      and the packets of a burst `args.packet_spacing` apart. Sessions start at random times within the first burst interval.
+    - Returns the sent payloads, keys are source ports.
+    """
+    import numpy as np
+    covert_channel = MyCovertChannel()
+    frame = covert_channel.build_udp_frame(args.ip, args.port, b"0b00000001", "raw")
+    ethernet = bytes(12) + b"\x08\x00"
+    payloads = {}
+    times = []
+    session_ids = []
+    for session in range(args.sessions):
+        payload = random_payload(args.size, args.stopping_character)
+        sender = make_sender(covert_channel, args.ip, args.port, "udp")
+        burst_sizes, table = encode_offline(sender, payload)
+        burst_sizes = np.concatenate((list(table), burst_sizes)).astype(np.int64)
+        burst_starts = random.uniform(0, args.delay_between_bursts) + np.arange(len(burst_sizes)) * args.delay_between_bursts
+        # Index of every packet inside its burst
+        packet_index = np.arange(burst_sizes.sum()) - np.repeat(np.cumsum(burst_sizes) - burst_sizes, burst_sizes)
+        times.append((np.repeat(burst_starts, burst_sizes) + packet_index * args.packet_spacing) / 1000)
+        session_ids.append(np.full(len(packet_index), session, dtype=np.int64))
+        payloads[10000 + session] = payload
+    times = np.concatenate(times)
+    session_ids = np.concatenate(session_ids)
+    order = np.argsort(times, kind="stable")
+    times = times[order] + 1700000000
+    session_ids = session_ids[order]
+
+    packet = ethernet + frame
+    record = np.dtype([("seconds", "<u4"), ("microseconds", "<u4"), ("captured", "<u4"), ("length", "<u4"), ("data", f"S{len(packet)}")])
+    frames = np.array([packet[:34] + struct.pack("!H", 10000 + session) + packet[36:] for session in range(args.sessions)], dtype=f"S{len(packet)}")
+    with open(file_name, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for start in range(0, len(times), 1000000):
+            chunk = slice(start, start + 1000000)
+            records = np.empty(len(times[chunk]), dtype=record)
+            records["seconds"] = times[chunk]
+            records["microseconds"] = np.round((times[chunk] % 1) * 1e6).clip(0, 999999)
+            records["captured"] = len(packet)
+            records["length"] = len(packet)
+            records["data"] = frames[session_ids[chunk]]
+            records.tofile(f)
+    return payloads
+
+
+def bench_pcap(args):
+    """
+    - Measures the offline decoder on a synthetic capture of many concurrent sessions.
+    - The capture is written once by `write_synthetic_capture` and decoded with `read_capture` and `decode_capture`.
+    - Reports the number of correctly decoded sessions and how many times faster than real time the capture is decoded.
+    """
+    from decode_pcap import read_capture, decode_capture
+    log_dir = tempfile.mkdtemp(prefix="covert_pcap_")
+    file_name = args.capture or os.path.join(log_dir, "capture.pcap")
+    start = time.perf_counter()
+    payloads = write_synthetic_capture(file_name, args)
+    print(f"wrote {os.path.getsize(file_name) / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s")
+
+    receiver = make_receiver(
+        MyCovertChannel(), args.ip, args.port, os.path.join(log_dir, "receiver.log"), stopping_character=args.stopping_character
+        )
+    start = time.perf_counter()
+    timestamps, sources = read_capture(file_name, args.port)
+    read_time = time.perf_counter() - start
+    sessions = decode_capture(receiver, timestamps, sources)
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for addr, data, success in sessions if success and data.encode("latin-1") == payloads.get(addr[1]))
+    captured_time = timestamps.max() - timestamps.min()
+    print(f"{len(timestamps)} packets, {correct}/{args.sessions} sessions correct")
+    print(f"{captured_time:.1f}s of traffic decoded in {elapsed:.2f}s (reading {read_time:.2f}s), "
+          f"{captured_time / elapsed:.0f}x real time, {len(timestamps) / elapsed / 1e6:.2f} M packets/s")
+    if args.capture is None:
+        os.remove(file_name)
+    return elapsed
+
+
+def bench_lanes(args):
+    """
+    - Measures the aggregate throughput of the striped mode over loopback for different numbers of lanes.
+    - The same random payload is sent every time with the `udp` send engine, lane i uses port + i.
+    - Without the burst tables, the expected rate grows linearly with the number of lanes.
+    """
+    payload = random_messages(1, args.size, args.seed, args.stopping_character)[0]
+    delays = {"delay_waiting_for_burst": args.delay_waiting_for_burst, "socket_awakening_delay": args.socket_awakening_delay}
+    results = {}
+    port = args.port
+    for lanes in args.lanes:
+        log_dir = tempfile.mkdtemp(prefix="covert_lanes_")
+        received = []
+        receiver = make_receiver(
+            MyCovertChannel(), args.ip, port, os.path.join(log_dir, "receiver.log"), lanes=lanes, sink=received.append,
+            stopping_character=args.stopping_character, **delays
+            )
+        sender = make_sender(
+            MyCovertChannel(), args.ip, port, "udp", os.path.join(log_dir, "sender.log"),
+            lanes=lanes, payload=payload, delay_between_bursts=args.delay_between_bursts, stopping_character=args.stopping_character
+            )
+        receiver_thread = threading.Thread(target=receiver.run)
+        receiver_thread.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        sender.run()
+        elapsed = time.perf_counter() - start
+        receiver_thread.join(timeout=args.timeout)
+        correct = received == [payload]
+        results[lanes] = len(payload) * 8 / elapsed
+        print(f"{lanes} lanes: {'correct' if correct else 'WRONG'}, {len(payload) * 8} bits in {elapsed:.2f}s -> {results[lanes]:.2f} bits/s ({results[lanes] / results[args.lanes[0]]:.2f}x)")
+        port += lanes * 2
+    return results
+
+
+def bench_spread(args):
+    """
+    - Measures the intra-burst spread, the time from the first to the last packet of a burst, of the `udp` and `gso` send engines.
+    - Bursts of `--burst-size` packets are sent over loopback `--gap` ms apart, and the receiving socket takes the arrival time of
+      every packet from the kernel (`SO_TIMESTAMPNS`), so the spread is not blurred by the reads.
+    - `--busy-threads` threads run next to the sender and take the interpreter from it in the middle of a burst, as a loaded sender would.
+    """
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            pass
+    busy_threads = [threading.Thread(target=busy, daemon=True) for _ in range(args.busy_threads)]
+    for thread in busy_threads:
+        thread.start()
+    timespec = struct.Struct("@qq")
+    so_timestampns = getattr(socket, "SO_TIMESTAMPNS", 35)
+    results = {}
+    try:
+        for engine in args.engines:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((args.ip, args.port))
+            sock.setsockopt(socket.SOL_SOCKET, so_timestampns, 1)
+            sock.setblocking(False)
+            covert_channel = MyCovertChannel()
+            covert_channel.open_send_engine(args.ip, args.port, engine)
+            frame = covert_channel.build_udp_frame(args.ip, args.port, b"0b00000001", engine)
+            spreads = []
+            lost = 0
+            for _ in range(args.bursts):
+                covert_channel.send_frames(frame, args.burst_size)
+                time.sleep(args.gap / 1000)
+                arrivals = []
+                try:
+                    while True:
+                        _, ancdata, _, _ = sock.recvmsg(2048, socket.CMSG_SPACE(timespec.size))
+                        for level, kind, data in ancdata:
+                            if level == socket.SOL_SOCKET and kind == so_timestampns:
+                                seconds, nanoseconds = timespec.unpack(data[:timespec.size])
+                                arrivals.append(seconds + nanoseconds * 1e-9)
+                except BlockingIOError:
+                    pass
+                if len(arrivals) == args.burst_size:
+                    spreads.append(max(arrivals) - min(arrivals))
+                else:
+                    lost += 1
+            effective = covert_channel.engine_kind
+            covert_channel.close_send_engine()
+            sock.close()
+            spreads.sort()
+            if not spreads:
+                print(f"{engine:>4}: no complete bursts")
+                continue
+            results[engine] = {
+                "mean": sum(spreads) / len(spreads), "p50": spreads[len(spreads) // 2],
+                "p99": spreads[int(len(spreads) * 0.99)], "max": spreads[-1],
+            }
+            fallback = f" (fell back to {effective})" if effective != engine else ""
+            print(f"{engine:>4}{fallback}: spread of {args.burst_size} packets mean {results[engine]['mean'] * 1e6:.1f} us, "
+                  f"p50 {results[engine]['p50'] * 1e6:.1f} us, p99 {results[engine]['p99'] * 1e6:.1f} us, "
+                  f"max {results[engine]['max'] * 1e6:.1f} us, {lost} incomplete bursts")
+    finally:
+        stop.set()
+    return results
+
+
+def count_packets(mode, ip, port, interface, delays, counter, ready):
+    """
+    - Receiver process of `bench_ring`: splits the packets to `port` into bursts with the `segmenter` (socket) or the `ring` path
+      and adds the burst sizes to `counter`.
+    - The UDP socket is bound in both modes, as `Receiver.run` does.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, port))
+    if mode == "ring":
+        segmenter = PacketRing(port, interface, *delays)
+    else:
+        segmenter = BurstSegmenter(sock, *delays)
+    ready.set()
+    for size in segmenter.bursts():
+        counter.value += size
+
+
+def bench_ring(args):
+    """
+    - Compares the packet rate the `segmenter` (UDP socket) and the `ring` (`AF_PACKET` TPACKET_V3) receive paths keep up with, over loopback.
+    - For every rate, the receiver runs in its own process and the sender sends bursts of `--burst-size` packets with the `udp` engine
+      for `--duration` seconds. On loopback a `gso` burst reaches the ring as one packet, so it is not used here. The packets the receiver counted in its bursts are compared with the packets sent.
+    - The highest rate at which a path counted at least 99.9% of the packets is its sustainable rate.
+    """
+    delays = (args.socket_awakening_delay, args.delay_waiting_for_burst)
+    results = {}
+    port = args.port
+    print(f"{'mode':>9} {'rate':>9} {'sent':>9} {'counted':>9} {'ratio':>7}")
+    for mode in args.modes:
+        results[mode] = {}
+        for rate in args.rates:
+            counter = multiprocessing.RawValue("q", 0)
+            ready = multiprocessing.Event()
+            receiver = multiprocessing.Process(target=count_packets, args=(mode, args.ip, port, args.interface, delays, counter, ready), daemon=True)
+            receiver.start()
+            ready.wait(5)
+            time.sleep(0.2)
+            covert_channel = MyCovertChannel()
+            covert_channel.open_send_engine(args.ip, port, "udp")
+            frame = covert_channel.build_udp_frame(args.ip, port, b"0b00000001", "udp")
+            sent = 0
+            start = time.perf_counter()
+            while True:
+                elapsed = time.perf_counter() - start
+                if elapsed >= args.duration:
+                    break
+                due = int(elapsed * rate) // args.burst_size * args.burst_size
+                while sent < due:
+                    covert_channel.send_frames(frame, args.burst_size)
+                    sent += args.burst_size
+                time.sleep(0.0005)
+            covert_channel.close_send_engine()
+            time.sleep(0.5)
+            counted = counter.value
+            receiver.terminate()
+            receiver.join()
+            results[mode][rate] = counted / sent if sent else None
+            print(f"{mode:>9} {rate:>9} {sent:>9} {counted:>9} {counted / sent:>7.1%}")
+            port += 1
+        sustained = [rate for rate, ratio in results[mode].items() if ratio is not None and ratio >= 0.999]
+        print(f"{mode:>9}: sustained up to {max(sustained) if sustained else 0} packets/s")
+    return results
+
+
+def busy_process():
+    """
+    Spins forever, a CPU hog for `bench_pacer`.
+    """
+    while True:
+        pass
+
+
+def bench_pacer(args):
+    """
+    - Compares the "sleep" and "deadline" modes of `BurstPacer`, next to `--busy-processes` processes that compete for the CPU.
+    - First it waits `--gaps` gaps of `--delay-between-bursts` with each mode and reports how much longer the achieved gaps are than requested:
+      mean, median, 99th percentile, maximum, and the sum over the gaps of one 16-byte message (130 gaps with the example parameters).
+    - Then it runs the channel `--runs` times over loopback with each mode at the given delays and reports the correct runs.
+    """
+    busy = [multiprocessing.Process(target=busy_process, daemon=True) for _ in range(args.busy_processes)]
+    for process in busy:
+        process.start()
+    results = {}
+    port = args.port
+    try:
+        gap = args.delay_between_bursts / 1000
+        for mode in args.modes:
+            pacer = BurstPacer(time, mode, args.pacer_spin / 1000)
+            overshoots = []
+            for _ in range(args.gaps):
+                start = time.monotonic()
+                pacer.wait(gap)
+                overshoots.append(time.monotonic() - start - gap)
+            overshoots.sort()
+            mean = sum(overshoots) / len(overshoots)
+            p50 = overshoots[len(overshoots) // 2]
+            p99 = overshoots[int(len(overshoots) * 0.99)]
+            print(f"{mode:>8}: overshoot mean {mean * 1e3:.3f} ms, p50 {p50 * 1e3:.3f} ms, p99 {p99 * 1e3:.3f} ms, max {overshoots[-1] * 1e3:.3f} ms, "
+                  f"{mean * 130 * 1e3:.1f} ms over 130 gaps")
+            results[mode] = {"mean": mean, "p50": p50, "p99": p99, "max": overshoots[-1], "correct": None}
+            if not args.runs:
+                continue
+            correct = 0
+            for _ in range(args.runs):
+                ok, _, _ = run_channel(
+                    args.ip, port,
+                    {"delay_between_bursts": args.delay_between_bursts, "pacer": mode, "pacer_spin": args.pacer_spin},
+                    {"delay_waiting_for_burst": args.delay_waiting_for_burst, "socket_awakening_delay": args.socket_awakening_delay},
+                    args.timeout
+                    )
+                correct += ok
+                port += 1
+            print(f"{mode:>8}: {correct}/{args.runs} runs correct at {args.delay_between_bursts}/{args.delay_waiting_for_burst}/{args.socket_awakening_delay} ms")
+            results[mode]["correct"] = correct / args.runs
+    finally:
+        for process in busy:
+            process.terminate()
+    return results
+
+
+def recovered_bytes(receiver, expected):
+    """
+    - Counts the bytes of `expected` that the receiver decoded at the right position.
+    - Unframed, this is the part of the output before the first wrong byte. Framed, it is every frame that arrived.
+    """
+    if receiver.frame_size is None:
+        output = bytes(receiver.codec.output) if getattr(receiver, "codec", None) is not None else b""
+        count = 0
+        for received_byte, expected_byte in zip(output, expected):
+            if received_byte != expected_byte:
+                break
+            count += 1
+        return count
+    frame_size = receiver.frame_size
+    return sum(
+        len(chunk) for index, chunk in receiver.frames.items()
+        if chunk == expected[index * frame_size:(index + 1) * frame_size]
+        )
+
+
+def bench_frames(args):
+    """
+    - Compares the framed and the unframed mode on the simulated network of `simulator.py` for different packet loss rates.
+    - For every loss rate and frame size it reports the fraction of payload bytes that arrived at the right position,
+      and the number of packets sent per payload byte, which is the cost of the sync bursts and the tables in every frame.
+    """
+    messages = random_messages(args.runs, args.size, args.seed, args.stopping_character)
+    params = {"burst_max": args.burst_max, "delay_between_bursts": args.delay_between_bursts, "stopping_character": args.stopping_character}
+    results = {}
+    print(f"{'loss':>6} {'frame':>6} {'recovered':>9} {'pkts/byte':>9}")
+    for loss in args.loss:
+        for frame_size in [None] + args.frame_sizes:
+            recovered = 0
+            packets = 0
+            for run, message in enumerate(messages):
+                network = SimNetwork(loss=loss, seed=args.seed + run)
+                _, receiver, _ = run_simulation(
+                    sender_params(args.ip, args.port, "udp", frame_size=frame_size, **params),
+                    receiver_params(args.ip, args.port, frame_size=frame_size, **params),
+                    message, network
+                    )
+                recovered += recovered_bytes(receiver, message + args.stopping_character.encode())
+                packets += network.sent
+            total = len(messages) * (args.size + 1)
+            results[(loss, frame_size)] = recovered / total
+            print(f"{loss:>6g} {frame_size or '-':>6} {recovered / total:>9.1%} {packets / total:>9.1f}")
+    return results
+
+
+def bench_gaps(args):
+    """
+    - Compares the size-only symbols with the size and gap symbols of `gap_bits` on the simulated network of `simulator.py`, for different amounts of jitter.
+    - For every jitter and number of gap bits it reports the runs decoded correctly and the bit rate of the message over the virtual send time.
+    - A gap class adds `gap_step` ms to the gap before a burst, so the bits of the gap are cheap while `gap_step` is small against `delay_between_bursts`,
+      and the jitter decides how small it can be.
+    """
+    messages = random_messages(args.runs, args.size, args.seed, args.stopping_character)
+    params = {"burst_max": args.burst_max, "delay_between_bursts": args.delay_between_bursts, "stopping_character": args.stopping_character}
+    results = {}
+    print(f"{'jitter':>6} {'gap bits':>8} {'correct':>7} {'bits/s':>7}")
+    for jitter in args.jitter:
+        for gap_bits in args.gap_bits:
+            correct = 0
+            duration = 0.0
+            for run, message in enumerate(messages):
+                ok, _, seconds = simulate(
+                    sender_params(args.ip, args.port, "udp", gap_bits=gap_bits, gap_step=args.gap_step, **params),
+                    receiver_params(args.ip, args.port, gap_bits=gap_bits, **params),
+                    message, SimNetwork(jitter=jitter, seed=args.seed + run)
+                    )
+                correct += ok
+                duration += seconds
+            bits_per_second = len(messages) * (args.size + 1) * 8 / duration
+            results[(jitter, gap_bits)] = (correct, bits_per_second)
+            print(f"{jitter:>6g} {gap_bits:>8} {f'{correct}/{len(messages)}':>7} {bits_per_second:>7.1f}")
+    return results
+
+
+def run_reliable(ip, port, message, send_params, receive_params, timeout):
+    """
+    - Sends `message` as the sender payload over loopback with the `udp` send engine, as `run_loopback` does, in any of the framed modes.
+    - Returns (correct, sender wall time in seconds, frames sent again by the sender).
+    - The feedback of the reliable mode uses `port + 1`, so every run should use its own pair of ports.
+    """
+    log_dir = tempfile.mkdtemp(prefix="covert_arq_")
+    send_params = dict(send_params, ip=ip, port=port, send_engine="udp", payload=message, log_file_name=os.path.join(log_dir, "sender.log"))
+    receive_params = dict(receive_params, ip=ip, port=port, arq_ip=ip, receive_engine="segmenter", log_file_name=os.path.join(log_dir, "receiver.log"))
+    sender = Sender(MyCovertChannel(), send_params)
+    receiver = Receiver(MyCovertChannel(), receive_params)
+    receiver_thread = threading.Thread(target=receiver.run, daemon=True)
+    receiver_thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    sender.run()
+    elapsed = time.perf_counter() - start
+    receiver_thread.join(timeout=timeout)
+    if receiver.frame_size is not None:
+        received = b"".join(receiver.frames[index] for index in sorted(receiver.frames))
+    else:
+        received = bytes(receiver.codec.output) if getattr(receiver, "codec", None) is not None else b""
+    correct = not receiver_thread.is_alive() and received == message + receiver.stopping_character.encode()
+    return correct, elapsed, sender.retransmitted_frames
+
+
+def bench_arq(args):
+    """
+    - Compares the unframed, the framed and the reliable (`arq`) mode over loopback at aggressive delays,
+      next to `--busy-processes` processes that compete for the CPU, so some bursts are split or merged.
+    - For every mode it reports the runs delivered correctly, the mean sender time and the frames sent again per run.
+    """
+    busy = [multiprocessing.Process(target=busy_process, daemon=True) for _ in range(args.busy_processes)]
+    for process in busy:
+        process.start()
+    messages = random_messages(args.runs, args.size, args.seed, args.stopping_character)
+    modes = {
+        "unframed": {},
+        "framed": {"frame_size": args.frame_size},
+        "arq": {"frame_size": args.frame_size, "arq": True},
+    }
+    results = {}
+    port = args.port
+    print(f"{'mode':>8} {'correct':>7} {'time s':>7} {'resent':>6}")
+    try:
+        for mode in args.modes:
+            correct = 0
+            elapsed = 0.0
+            resent = 0
+            for message in messages:
+                ok, seconds, frames = run_reliable(
+                    args.ip, port, message,
+                    sender_params(args.ip, port, "udp", delay_between_bursts=args.delay_between_bursts, pacer="sleep",
+                                  arq_timeout=args.arq_timeout, stopping_character=args.stopping_character, **modes[mode]),
+                    receiver_params(args.ip, port, delay_waiting_for_burst=args.delay_waiting_for_burst,
+                                    socket_awakening_delay=args.socket_awakening_delay, stopping_character=args.stopping_character, **modes[mode]),
+                    args.timeout
+                    )
+                correct += ok
+                elapsed += seconds
+                resent += frames
+                port += 2
+            results[mode] = {"correct": correct / len(messages), "time": elapsed / len(messages), "resent": resent / len(messages)}
+            print(f"{mode:>8} {f'{correct}/{len(messages)}':>7} {elapsed / len(messages):>7.2f} {resent / len(messages):>6.1f}")
+    finally:
+        for process in busy:
+            process.terminate()
+    return results
+
+
+def bench_coding(args):
+    """
+    - Reports the bits per character of the `coding` parameter on `--messages` messages of `generate_random_message`,
+      against 8 bits unchanged and the entropy of the character distribution the code is built for.
+    - With `--corpus`, the code is built from that sample file instead, and the messages are read from it when `--corpus-messages` is set.
+    - It also runs `--runs` messages with and without coding on the simulated network of `simulator.py` and reports the packets and the time per message.
+    """
+    covert_channel = MyCovertChannel()
+    random.seed(args.seed)
+    if args.corpus is not None and args.corpus_messages:
+        with open(args.corpus, "rb") as corpus_file:
+            messages = [line.rstrip(b"\n") + b"." for line in corpus_file if line.strip()][:args.messages]
+    else:
+        messages = [covert_channel.generate_random_message(args.length, args.length).encode() for _ in range(args.messages)]
+    weights = covert_channel.corpus_weights(args.corpus) if args.corpus is not None else covert_channel.random_message_weights(".", args.length)
+    code = covert_channel.payload_code("huffman", args.corpus, ".")
+    total = sum(weights)
+    entropy = -sum(weight / total * math.log2(weight / total) for weight in weights)
+    characters = sum(len(message) for message in messages)
+    coded_bytes = sum(len(bytes(code.encode(message))) for message in messages)
+    coded_bits = sum(len(code.codes[byte]) for message in messages for byte in message)
+    print(f"characters: {characters} in {len(messages)} messages, entropy of the code distribution {entropy:.2f} bits/char")
+    print(f"{'':>9} {'bits/char':>9} {'saved':>6}")
+    print(f"{'raw':>9} {8:>9.2f} {'-':>6}")
+    print(f"{'huffman':>9} {coded_bits / characters:>9.2f} {1 - coded_bits / characters / 8:>6.1%}")
+    print(f"{'padded':>9} {coded_bytes * 8 / characters:>9.2f} {1 - coded_bytes / characters:>6.1%}")
+    results = {"entropy": entropy, "bits_per_char": coded_bits / characters, "padded_bits_per_char": coded_bytes * 8 / characters}
+    if not args.runs:
+        return results
+    # Corpus lines may contain the stopping character, the random messages never contain either character
+    send_params, receive_params = {"delay_between_bursts": 65, "escape_character": "\\"}, {"escape_character": "\\"}
+    if args.corpus is not None:
+        send_params["coding_corpus"] = receive_params["coding_corpus"] = args.corpus
+    print(f"{'':>9} {'correct':>7} {'packets':>7} {'time s':>7}")
+    for coding in (None, "huffman"):
+        correct = 0
+        packets = 0
+        duration = 0.0
+        for run, message in enumerate(messages[:args.runs]):
+            network = SimNetwork(seed=args.seed + run)
+            _, received, seconds = simulate(
+                sender_params(args.ip, args.port, "udp", coding=coding, **send_params),
+                receiver_params(args.ip, args.port, coding=coding, **receive_params),
+                message[:-1], network
+                )
+            correct += received == bytes(covert_channel.stuff_bytes([message[:-1]], ".", "\\"))
+            duration += seconds
+            packets += network.sent
+        runs = min(args.runs, len(messages))
+        results[coding or "raw"] = {"correct": correct / runs, "time": duration / runs}
+        print(f"{coding or 'raw':>9} {f'{correct}/{runs}':>7} {packets / runs:>7.1f} {duration / runs:>7.2f}")
+    return results
+
+
+def bench_sink(args):
+    """
+    - Measures the cost per byte of the streaming receive path without sockets, as `bench_codec` does, for different sinks:
+      a callable, and a file through `CheckpointSink` with and without a checkpoint, for every `--flush-intervals` value.
+    - A flush interval of 0 flushes, syncs and checkpoints after every byte, the worst case.
+    """
+    payload = random_payload(args.size, args.stopping_character)
+    sender = make_sender(MyCovertChannel(), args.ip, args.port, "udp")
+    burst_sizes, table = encode_offline(sender, payload)
+    log_dir = tempfile.mkdtemp(prefix="covert_sink_")
+    sink_file_name = os.path.join(log_dir, "sink.bin")
+    checkpoint_file_name = os.path.join(log_dir, "sink.checkpoint")
+    sinks = [("callable", bytearray().extend, None, None)]
+    for flush_interval in args.flush_intervals:
+        sinks.append((f"file {flush_interval:g} ms", sink_file_name, flush_interval, None))
+        sinks.append((f"checkpoint {flush_interval:g} ms", sink_file_name, flush_interval, checkpoint_file_name))
+    results = {}
+    for name, sink, flush_interval, checkpoint in sinks:
+        receiver = make_receiver(
+            MyCovertChannel(), args.ip, args.port, sink=sink, flush_interval=flush_interval, checkpoint=checkpoint,
+            stopping_character=args.stopping_character
+            )
+        receiver.burstsizes_to_signal = dict(table)
+        receiver.receive_engine = "segmenter"
+        receiver.burst_stream = iter(burst_sizes)
+        start = time.perf_counter()
+        receiver.receive_stream()
+        elapsed = time.perf_counter() - start
+        if callable(sink):
+            correct = sink.__self__ == payload[:-1]
+        else:
+            with open(sink, "rb") as sink_file:
+                correct = sink_file.read() == payload[:-1]
+        results[name] = elapsed / args.size
+        print(f"{name:>20}: {'correct' if correct else 'WRONG'}, {elapsed / args.size * 1e6:.2f} us/byte")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the covert channel.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    send_parser = subparsers.add_parser("send", help="packets per second of the send paths")
+    send_parser.add_argument("--ip", default="127.0.0.1")
+    send_parser.add_argument("--port", type=int, default=12345)
+    send_parser.add_argument("--interface", default="lo")
+    send_parser.add_argument("--packets", type=int, default=100000)
+    send_parser.add_argument("--scapy-packets", type=int, default=500)
+    send_parser.add_argument("--burst-size", type=int, default=3)
+    send_parser.add_argument("--engines", nargs="+", default=["scapy", "raw", "udp", "gso"])
+    send_parser.set_defaults(func=bench_send)
+
+    sessions_parser = subparsers.add_parser("sessions", help="aggregate decoded rate of the multi-session receiver")
+    sessions_parser.add_argument("--ip", default="127.0.0.1")
+    sessions_parser.add_argument("--port", type=int, default=12345)
+    sessions_parser.add_argument("--senders", type=int, default=100)
+    sessions_parser.add_argument("--stagger", type=float, default=5, help="delay between sender starts in ms")
+    sessions_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    sessions_parser.add_argument("--timeout", type=float, default=60)
+    sessions_parser.set_defaults(func=bench_sessions)
+
+    symbols_parser = subparsers.add_parser("symbols", help="throughput for different bits per burst")
+    symbols_parser.add_argument("--ip", default="127.0.0.1")
+    symbols_parser.add_argument("--port", type=int, default=12345)
+    symbols_parser.add_argument("--symbol-bits", type=int, nargs="+", default=[1, 2, 3, 4])
+    symbols_parser.add_argument("--symbol-spacing", type=int, default=1)
+    symbols_parser.add_argument("--burst-max", type=int, default=17)
+    symbols_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    symbols_parser.add_argument("--delay-waiting-for-burst", type=float, default=50)
+    symbols_parser.add_argument("--socket-awakening-delay", type=float, default=30)
+    symbols_parser.set_defaults(func=bench_symbols)
+
+    codec_parser = subparsers.add_parser("codec", help="cost per byte of the encode and decode paths without sockets")
+    codec_parser.add_argument("--ip", default="127.0.0.1")
+    codec_parser.add_argument("--port", type=int, default=12345)
+    codec_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000, 10000000])
+    codec_parser.add_argument("--burst-max", type=int, default=3)
+    codec_parser.add_argument("--symbol-bits", type=int, default=1)
+    codec_parser.add_argument("--stopping-character", default=".")
+    codec_parser.set_defaults(func=bench_codec)
+
+    fec_parser = subparsers.add_parser("fec", help="goodput against injected burst error rate")
+    fec_parser.add_argument("--ip", default="127.0.0.1")
+    fec_parser.add_argument("--port", type=int, default=12345)
+    fec_parser.add_argument("--size", type=int, default=2000)
+    fec_parser.add_argument("--fec", nargs="+", default=["none", "hamming"])
+    fec_parser.add_argument("--error-rates", type=float, nargs="+", default=[0, 0.001, 0.005, 0.01, 0.02, 0.05])
+    fec_parser.add_argument("--burst-max", type=int, default=3)
+    fec_parser.add_argument("--symbol-bits", type=int, default=1)
+    fec_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    fec_parser.add_argument("--seed", type=int, default=0)
+    fec_parser.add_argument("--stopping-character", default=".")
+    fec_parser.set_defaults(func=bench_fec)
+
+    timestamps_parser = subparsers.add_parser("timestamps", help="user against kernel receive timestamps under load")
+    timestamps_parser.add_argument("--ip", default="127.0.0.1")
+    timestamps_parser.add_argument("--port", type=int, default=12345)
+    timestamps_parser.add_argument("--modes", nargs="+", default=["user", "kernel"])
+    timestamps_parser.add_argument("--runs", type=int, default=10)
+    timestamps_parser.add_argument("--busy-threads", type=int, default=2)
+    timestamps_parser.add_argument("--delay-between-bursts", type=float, default=8)
+    timestamps_parser.add_argument("--delay-waiting-for-burst", type=float, default=5)
+    timestamps_parser.add_argument("--socket-awakening-delay", type=float, default=3)
+    timestamps_parser.add_argument("--timeout", type=float, default=10)
+    timestamps_parser.set_defaults(func=bench_timestamps)
+
+    startup_parser = subparsers.add_parser("startup", help="time from sender process start to first packet")
+    startup_parser.add_argument("--ip", default="127.0.0.1")
+    startup_parser.add_argument("--port", type=int, default=12345)
+    startup_parser.add_argument("--runs", type=int, default=10)
+    startup_parser.add_argument("--timeout", type=float, default=30)
+    startup_parser.set_defaults(func=bench_startup)
+
+    pcap_parser = subparsers.add_parser("pcap", help="offline decoder speed on a synthetic capture")
+    pcap_parser.add_argument("--ip", default="127.0.0.1")
+    pcap_parser.add_argument("--port", type=int, default=12345)
+    pcap_parser.add_argument("--sessions", type=int, default=200)
+    pcap_parser.add_argument("--size", type=int, default=1000, help="payload bytes per session")
+    pcap_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    pcap_parser.add_argument("--packet-spacing", type=float, default=0.05, help="time between the packets of a burst in ms")
+    pcap_parser.add_argument("--capture", help="keep the capture at this path instead of a temporary file")
+    pcap_parser.add_argument("--stopping-character", default=".")
+    pcap_parser.set_defaults(func=bench_pcap)
+
+    lanes_parser = subparsers.add_parser("lanes", help="aggregate throughput of the striped mode for different numbers of lanes")
+    lanes_parser.add_argument("--ip", default="127.0.0.1")
+    lanes_parser.add_argument("--port", type=int, default=12345)
+    lanes_parser.add_argument("--lanes", type=int, nargs="+", default=[1, 2, 4, 8])
+    lanes_parser.add_argument("--size", type=int, default=64)
+    lanes_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    lanes_parser.add_argument("--delay-waiting-for-burst", type=float, default=50)
+    lanes_parser.add_argument("--socket-awakening-delay", type=float, default=30)
+    lanes_parser.add_argument("--timeout", type=float, default=60)
+    lanes_parser.add_argument("--seed", type=int, default=0)
+    lanes_parser.add_argument("--stopping-character", default=".")
+    lanes_parser.set_defaults(func=bench_lanes)
+
+    spread_parser = subparsers.add_parser("spread", help="time from the first to the last packet of a burst for the udp and gso engines")
+    spread_parser.add_argument("--ip", default="127.0.0.1")
+    spread_parser.add_argument("--port", type=int, default=12345)
+    spread_parser.add_argument("--engines", nargs="+", default=["udp", "gso"])
+    spread_parser.add_argument("--bursts", type=int, default=1000)
+    spread_parser.add_argument("--burst-size", type=int, default=17)
+    spread_parser.add_argument("--gap", type=float, default=2, help="time between bursts in ms")
+    spread_parser.add_argument("--busy-threads", type=int, default=0)
+    spread_parser.set_defaults(func=bench_spread)
+
+    ring_parser = subparsers.add_parser("ring", help="packet rate the socket and the AF_PACKET ring receive paths keep up with")
+    ring_parser.add_argument("--ip", default="127.0.0.1")
+    ring_parser.add_argument("--port", type=int, default=12345)
+    ring_parser.add_argument("--interface", default="lo")
+    ring_parser.add_argument("--modes", nargs="+", default=["segmenter", "ring"])
+    ring_parser.add_argument("--rates", type=int, nargs="+", default=[10000, 30000, 100000, 200000, 300000])
+    ring_parser.add_argument("--burst-size", type=int, default=17)
+    ring_parser.add_argument("--duration", type=float, default=2)
+    ring_parser.add_argument("--socket-awakening-delay", type=float, default=3)
+    ring_parser.add_argument("--delay-waiting-for-burst", type=float, default=5)
+    ring_parser.set_defaults(func=bench_ring)
+
+    pacer_parser = subparsers.add_parser("pacer", help="achieved against requested gaps of the burst pacer modes under load")
+    pacer_parser.add_argument("--ip", default="127.0.0.1")
+    pacer_parser.add_argument("--port", type=int, default=12345)
+    pacer_parser.add_argument("--modes", nargs="+", default=["sleep", "deadline"])
+    pacer_parser.add_argument("--gaps", type=int, default=1000)
+    pacer_parser.add_argument("--runs", type=int, default=5)
+    pacer_parser.add_argument("--busy-processes", type=int, default=2)
+    pacer_parser.add_argument("--pacer-spin", type=float, default=1)
+    pacer_parser.add_argument("--delay-between-bursts", type=float, default=8)
+    pacer_parser.add_argument("--delay-waiting-for-burst", type=float, default=5)
+    pacer_parser.add_argument("--socket-awakening-delay", type=float, default=3)
+    pacer_parser.add_argument("--timeout", type=float, default=30)
+    pacer_parser.set_defaults(func=bench_pacer)
+
+    frames_parser = subparsers.add_parser("frames", help="recovered bytes of the framed and unframed modes against packet loss")
+    frames_parser.add_argument("--ip", default="127.0.0.1")
+    frames_parser.add_argument("--port", type=int, default=12345)
+    frames_parser.add_argument("--loss", type=float, nargs="+", default=[0, 0.0001, 0.0005, 0.001, 0.005])
+    frames_parser.add_argument("--frame-sizes", type=int, nargs="+", default=[16, 64, 255])
+    frames_parser.add_argument("--size", type=int, default=1000)
+    frames_parser.add_argument("--runs", type=int, default=10)
+    frames_parser.add_argument("--burst-max", type=int, default=3)
+    frames_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    frames_parser.add_argument("--seed", type=int, default=0)
+    frames_parser.add_argument("--stopping-character", default=".")
+    frames_parser.set_defaults(func=bench_frames)
+
+    gaps_parser = subparsers.add_parser("gaps", help="bit rate of the size and gap symbols against jitter")
+    gaps_parser.add_argument("--ip", default="127.0.0.1")
+    gaps_parser.add_argument("--port", type=int, default=12345)
+    gaps_parser.add_argument("--jitter", type=float, nargs="+", default=[0, 2, 5, 10])
+    gaps_parser.add_argument("--gap-bits", type=int, nargs="+", default=[0, 1, 2, 3])
+    gaps_parser.add_argument("--gap-step", type=float, default=20)
+    gaps_parser.add_argument("--size", type=int, default=64)
+    gaps_parser.add_argument("--runs", type=int, default=20)
+    gaps_parser.add_argument("--burst-max", type=int, default=3)
+    gaps_parser.add_argument("--delay-between-bursts", type=float, default=65)
+    gaps_parser.add_argument("--seed", type=int, default=0)
+    gaps_parser.add_argument("--stopping-character", default=".")
+    gaps_parser.set_defaults(func=bench_gaps)
+
+    arq_parser = subparsers.add_parser("arq", help="delivered messages of the unframed, framed and reliable modes at aggressive delays")
+    arq_parser.add_argument("--ip", default="127.0.0.1")
+    arq_parser.add_argument("--port", type=int, default=12345)
+    arq_parser.add_argument("--modes", nargs="+", default=["unframed", "framed", "arq"])
+    arq_parser.add_argument("--size", type=int, default=64)
+    arq_parser.add_argument("--frame-size", type=int, default=16)
+    arq_parser.add_argument("--runs", type=int, default=5)
+    arq_parser.add_argument("--busy-processes", type=int, default=2)
+    arq_parser.add_argument("--delay-between-bursts", type=float, default=4)
+    arq_parser.add_argument("--delay-waiting-for-burst", type=float, default=2)
+    arq_parser.add_argument("--socket-awakening-delay", type=float, default=1)
+    arq_parser.add_argument("--arq-timeout", type=float, default=200)
+    arq_parser.add_argument("--seed", type=int, default=0)
+    arq_parser.add_argument("--stopping-character", default=".")
+    arq_parser.add_argument("--timeout", type=float, default=10)
+    arq_parser.set_defaults(func=bench_arq)
+
+    coding_parser = subparsers.add_parser("coding", help="bits per character saved by the Huffman coding of the message")
+    coding_parser.add_argument("--ip", default="127.0.0.1")
+    coding_parser.add_argument("--port", type=int, default=12345)
+    coding_parser.add_argument("--messages", type=int, default=10000)
+    coding_parser.add_argument("--length", type=int, default=16)
+    coding_parser.add_argument("--corpus", help="sample file the code is built from")
+    coding_parser.add_argument("--corpus-messages", action="store_true", help="use the lines of the corpus as the messages")
+    coding_parser.add_argument("--runs", type=int, default=50)
+    coding_parser.add_argument("--seed", type=int, default=0)
+    coding_parser.set_defaults(func=bench_coding)
+
+    sink_parser = subparsers.add_parser("sink", help="cost per byte of the streaming receive path with the checkpointed file sink")
+    sink_parser.add_argument("--ip", default="127.0.0.1")
+    sink_parser.add_argument("--port", type=int, default=12345)
+    sink_parser.add_argument("--size", type=int, default=20000)
+    sink_parser.add_argument("--flush-intervals", type=float, nargs="+", default=[1000, 10, 0])
+    sink_parser.add_argument("--stopping-character", default=".")
+    sink_parser.set_defaults(func=bench_sink)
+
+    sweep_parser = subparsers.add_parser("sweep", help="throughput and bit error rate over a parameter grid")
+    sweep_parser.add_argument("--link", choices=["sim", "loopback"], default="sim")
+    sweep_parser.add_argument("--ip", default="127.0.0.1")
+    sweep_parser.add_argument("--port", type=int, default=12345, help="first port, loopback points use consecutive ports")
+    sweep_parser.add_argument("--burst-max", type=int, nargs="+", default=[3, 5])
+    sweep_parser.add_argument("--history-size", type=int, nargs="+", default=[4])
+    sweep_parser.add_argument("--delay-between-bursts", type=float, nargs="+", default=[65, 30])
+    sweep_parser.add_argument("--delay-waiting-for-burst", type=float, nargs="+", default=[50, 20])
+    sweep_parser.add_argument("--socket-awakening-delay", type=float, nargs="+", default=[30, 10])
+    sweep_parser.add_argument("--payload-sizes", type=int, nargs="+", default=[16])
+    sweep_parser.add_argument("--repeats", type=int, default=1)
+    sweep_parser.add_argument("--seed", type=int, default=0)
+    sweep_parser.add_argument("--stopping-character", default=".")
+    sweep_parser.add_argument("--latency", type=float, default=1.0, help="sim link latency in ms")
+    sweep_parser.add_argument("--jitter", type=float, default=0.0, help="sim link jitter in ms")
+    sweep_parser.add_argument("--loss", type=float, default=0.0, help="sim link loss probability")
+    sweep_parser.add_argument("--timeout", type=float, default=30, help="loopback receiver timeout in seconds")
+    sweep_parser.add_argument("--json", help="file to write the results to as JSON")
+    sweep_parser.add_argument("--csv", help="file to write the results to as CSV")
+    sweep_parser.set_defaults(func=bench_sweep)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,275 @@
+import argparse
+import json
+import mmap
+import struct
+import time
+from array import array
+import numpy as np
+from MyCovertChannel import MyCovertChannel, Receiver, SessionDecoder
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+"""
+Magic numbers of the classic pcap format, values are (byte order, timestamp resolution in seconds).
+"""
+PCAPNG_SECTION = 0x0A0D0D0A
+PCAPNG_INTERFACE = 1
+PCAPNG_OBSOLETE_PACKET = 2
+PCAPNG_ENHANCED_PACKET = 6
+LINK_HEADERS = {0: 4, 1: 14, 12: 0, 101: 0, 113: 16, 228: 0, 276: 20}
+"""
+Length of the link layer header before the IP header, keys are pcap link types:
+null/loopback, Ethernet, raw IP (12, 101, 228), Linux cooked capture v1 and v2.
+"""
+
+
+def pcap_index(buffer):
+    """
+    - Walks the records of a classic pcap file.
+    - Returns arrays of the timestamps, the offsets of the packet data, the captured lengths and the link types of all records.
+    - Only the record headers are read here, the packets themselves are parsed with NumPy in `read_capture`.
+    - A capture of the channel port has records of the same length, so the walk guesses that the next records have the length of
+      the current one and checks a growing run of them at once with NumPy. Where the guess fails, records are walked one by one.
+    """
+    order, resolution = PCAP_MAGIC[bytes(buffer[:4])]
+    link_type = struct.unpack_from(order + "I", buffer, 20)[0]
+    unpack_record = struct.Struct(order + "III").unpack_from
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    parts = []
+    offset = 24
+    end = len(buffer) - 16
+    run = 256
+    try:
+        while offset <= end:
+            captured = unpack_record(buffer, offset)[2]
+            stride = 16 + captured
+            headers = offset + np.arange(min(run, (end - offset) // stride + 1), dtype=np.int64) * stride
+            same = unsigned(data, headers + 8, 4, order) == captured
+            accepted = len(same) if same.all() else int(np.argmin(same))
+            if accepted >= 16:
+                headers = headers[:accepted]
+                timestamps = unsigned(data, headers, 4, order) + unsigned(data, headers + 4, 4, order) * resolution
+                parts.append((timestamps, headers + 16, np.full(accepted, captured, dtype=np.int64)))
+                offset += accepted * stride
+                run = run * 2 if accepted == len(same) else 256
+                continue
+            timestamps = array("d")
+            offsets = array("q")
+            captured_lengths = array("q")
+            for _ in range(64):
+                if offset > end:
+                    break
+                seconds, fraction, captured = unpack_record(buffer, offset)
+                timestamps.append(seconds + fraction * resolution)
+                offsets.append(offset + 16)
+                captured_lengths.append(captured)
+                offset += 16 + captured
+            parts.append((np.frombuffer(timestamps), np.frombuffer(offsets, dtype=np.int64), np.frombuffer(captured_lengths, dtype=np.int64)))
+    finally:
+        # The memory map cannot be closed while NumPy views of it exist
+        del data
+    if not parts:
+        return np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    timestamps, offsets, captured_lengths = (np.concatenate(part) for part in zip(*parts))
+    return timestamps, offsets, captured_lengths, np.full(len(offsets), link_type, dtype=np.int64)
+
+
+def pcapng_index(buffer):
+    """
+    - Walks the blocks of a pcapng file one by one, returns the same arrays as `pcap_index`.
+    - Interface blocks give the link type and the timestamp resolution (`if_tsresol`) of the packets of each interface.
+    - Enhanced and obsolete packet blocks have the same layout up to the packet data. Simple packet blocks have no timestamp and are skipped.
+    """
+    timestamps = array("d")
+    offsets = array("q")
+    captured_lengths = array("q")
+    link_types = array("q")
+    end = len(buffer)
+    offset = 0
+    order = "<"
+    interfaces = []
+    while offset + 12 <= end:
+        block_type = struct.unpack_from(order + "I", buffer, offset)[0]
+        if block_type == PCAPNG_SECTION:
+            order = "<" if bytes(buffer[offset + 8:offset + 12]) == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+        block_length = struct.unpack_from(order + "I", buffer, offset + 4)[0]
+        if block_length < 12 or offset + block_length > end:
+            break
+        if block_type == PCAPNG_INTERFACE:
+            link_type = struct.unpack_from(order + "H", buffer, offset + 8)[0]
+            interfaces.append((link_type, pcapng_resolution(buffer, order, offset + 16, offset + block_length - 4)))
+        elif block_type == PCAPNG_ENHANCED_PACKET or block_type == PCAPNG_OBSOLETE_PACKET:
+            interface = struct.unpack_from(order + ("I" if block_type == PCAPNG_ENHANCED_PACKET else "H"), buffer, offset + 8)[0]
+            high, low, captured = struct.unpack_from(order + "III", buffer, offset + 12)
+            link_type, resolution = interfaces[interface]
+            timestamps.append(((high << 32) | low) * resolution)
+            offsets.append(offset + 28)
+            captured_lengths.append(captured)
+            link_types.append(link_type)
+        offset += block_length
+    return (
+        np.frombuffer(timestamps), np.frombuffer(offsets, dtype=np.int64),
+        np.frombuffer(captured_lengths, dtype=np.int64), np.frombuffer(link_types, dtype=np.int64)
+        )
+
+
+def pcapng_resolution(buffer, order, offset, end):
+    """
+    Reads the `if_tsresol` option of an interface block, the default resolution is 1 microsecond.
+    """
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(order + "HH", buffer, offset)
+        if code == 0:
+            break
+        if code == 9:
+            value = buffer[offset + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def unsigned(data, index, size, order=">"):
+    """
+    Reads unsigned integers of `size` (2 or 4) bytes in the given byte order at every position of `index`.
+    """
+    return data[index[:, None] + np.arange(size)].view(f"{order}u{size}").ravel()
+
+
+def read_capture(file_name, port):
+    """
+    - Reads a pcap or pcapng file through a memory map and keeps the IPv4 UDP packets sent to `port`.
+    - The record headers are walked one by one, then the link, IP and UDP headers of all packets are checked at once with NumPy.
+    - Returns the arrival times and the source of every kept packet as NumPy arrays.
+      A source is the source IP address and port packed into one integer, see `source_address`.
+    """
+    with open(file_name, "rb") as capture_file, mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        index = pcapng_index if buffer[:4] == struct.pack("<I", PCAPNG_SECTION) else pcap_index
+        timestamps, offsets, captured, link_types = index(buffer)
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        try:
+            last = len(data) - 1
+
+            def byte_at(position):
+                return data[np.minimum(position, last)]
+
+            ip = offsets.copy()
+            for link_type in np.unique(link_types):
+                ip[link_types == link_type] += LINK_HEADERS.get(int(link_type), 0)
+            # 802.1Q VLAN tag
+            vlan = (link_types == 1) & (byte_at(offsets + 12) == 0x81) & (byte_at(offsets + 13) == 0x00)
+            ip += vlan * 4
+            udp = ip + (byte_at(ip) & 0x0F).astype(np.int64) * 4
+            keep = (
+                (offsets + captured <= len(data))
+                & (captured >= udp - offsets + 8)
+                & (byte_at(ip) >> 4 == 4)
+                & (byte_at(ip + 9) == 17)
+                )
+            keep[keep] = unsigned(data, udp[keep] + 2, 2) == port
+            sources = unsigned(data, ip[keep] + 12, 4).astype(np.uint64) << np.uint64(16) | unsigned(data, udp[keep], 2)
+            timestamps = timestamps[keep]
+        finally:
+            # The memory map cannot be closed while NumPy views of it exist
+            del data
+    return timestamps, sources
+
+
+def source_address(source):
+    """
+    Unpacks a source of `read_capture` to an (IP address, port) tuple, as used for the session log names.
+    """
+    source = int(source)
+    ip = source >> 16
+    return (f"{ip >> 24}.{(ip >> 16) & 0xFF}.{(ip >> 8) & 0xFF}.{ip & 0xFF}", source & 0xFFFF)
+
+
+def split_bursts(timestamps, gap, window):
+    """
+    - Returns the burst sizes of one source, with the same rules as `BurstSegmenter`:
+      a burst ends when the next packet comes more than `gap` seconds after the last one,
+      or more than `window` seconds after the first packet of the burst.
+    - The gap rule is applied to the whole array at once. Only the bursts that are longer than the window are split again one packet at a time.
+    """
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(timestamps) > gap) + 1, [len(timestamps)]))
+    long_bursts = np.flatnonzero(timestamps[bounds[1:] - 1] - timestamps[bounds[:-1]] > window)
+    if len(long_bursts):
+        extra = []
+        for burst in long_bursts:
+            first = timestamps[bounds[burst]]
+            for i in range(bounds[burst] + 1, bounds[burst + 1]):
+                if timestamps[i] - first > window:
+                    extra.append(i)
+                    first = timestamps[i]
+        bounds = np.union1d(bounds, extra)
+    return np.diff(bounds)
+
+
+def decode_capture(receiver, timestamps, sources):
+    """
+    - Decodes every session in the captured packets with the `SessionDecoder` of the multi-session receiver.
+    - Packets are grouped by source, and the bursts of every source are fed to a decoder in time order.
+    - When a session finishes or fails, the next bursts of the same source start a new session, as in the live receiver.
+    - A session that is still open at the end of the capture is recorded as failed.
+    - The results are in `receiver.finished_sessions`.
+    - A receiver with `coding`, `gap_bits` or the other parameters that `SessionDecoder` does not decode is rejected, see `Receiver.check_session_params`.
+    """
+    receiver.check_session_params("the offline capture decoder")
+    gap = receiver.covert_channel.to_sec(receiver.socket_awakening_delay)
+    window = receiver.covert_channel.to_sec(receiver.delay_waiting_for_burst)
+    order = np.lexsort((timestamps, sources))
+    timestamps = timestamps[order]
+    sources = sources[order]
+    unique_sources, starts = np.unique(sources, return_index=True)
+    ends = np.append(starts[1:], len(sources))
+    for source, start, end in zip(unique_sources, starts, ends):
+        addr = source_address(source)
+        session = SessionDecoder(receiver, addr)
+        for burst_size in split_bursts(timestamps[start:end], gap, window).tolist():
+            try:
+                finished = session.feed(burst_size)
+            except Exception as e:
+                print(f"ERROR: An exception occurred in session {addr}: {e}")
+                receiver.session_finished(session, success=False)
+                session = SessionDecoder(receiver, addr)
+                continue
+            if finished:
+                receiver.session_finished(session, success=True)
+                session = SessionDecoder(receiver, addr)
+        if session.table_index:
+            receiver.session_finished(session, success=False)
+    return receiver.finished_sessions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decodes covert channel sessions from a pcap or pcapng capture.")
+    parser.add_argument("capture")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--port", type=int, help="receiver port of the channel, taken from the config by default")
+    parser.add_argument("--log-file-name", help="base name of the session logs, taken from the config by default")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        params = json.load(f)["receive"]["parameters"]
+    if args.log_file_name is not None:
+        params["log_file_name"] = args.log_file_name
+    port = args.port if args.port is not None else params["port"]
+    receiver = Receiver(MyCovertChannel(), params)
+
+    start = time.perf_counter()
+    timestamps, sources = read_capture(args.capture, port)
+    read_time = time.perf_counter() - start
+    sessions = decode_capture(receiver, timestamps, sources)
+    elapsed = time.perf_counter() - start
+    for addr, data, success in sessions:
+        print(f"{addr[0]}:{addr[1]} {'ok' if success else 'FAILED'} {data!r}")
+    if len(timestamps):
+        captured_time = timestamps.max() - timestamps.min()
+        print(f"{len(timestamps)} packets, {len(sessions)} sessions, {captured_time:.1f}s of traffic "
+              f"decoded in {elapsed:.2f}s (reading {read_time:.2f}s)")
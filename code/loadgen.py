@@ -0,0 +1,211 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from MyCovertChannel import MyCovertChannel, Receiver, Sender
+
+
+class LoadReceiver(Receiver):
+    """
+    Multi-session receiver that also records the wall clock time at which every session finished, for the end-to-end latency.
+    """
+    def __init__(self, covert_channel, params):
+        """
+        Constructor for the LoadReceiver class, takes the same parameters as `Receiver`.
+        """
+        super().__init__(covert_channel, params)
+        self.finish_times = []
+
+    def session_finished(self, session, success):
+        """
+        Records the finish time of the session before recording the session itself.
+        """
+        self.finish_times.append(time.time())
+        super().session_finished(session, success)
+
+
+def sender_process(index, params, messages, size, rate, offset, seed, go, start_time, results):
+    """
+    - Runs load sender `index`: waits for the `go` event and then `offset` seconds after `start_time`, then sends `messages` random payloads of `size` bytes one after the other.
+    - Every message is a new `Sender` run with the `udp` send engine, so every message is a session with its own source port.
+    - With a `rate`, message k starts `k / rate` seconds after the first, otherwise the messages are sent back to back.
+    - Puts (sender index, message index, payload, start time, end time) of every message on the `results` queue.
+    """
+    stopping_byte = ord(params.get("stopping_character", "."))
+    alphabet = [byte for byte in range(32, 127) if byte != stopping_byte]
+    rng = random.Random(seed)
+    go.wait()
+    start_at = start_time.value + offset
+    for message in range(messages):
+        payload = bytes(rng.choice(alphabet) for _ in range(size))
+        start = start_at + message / rate if rate else max(start_at, time.time())
+        time.sleep(max(start - time.time(), 0))
+        start = time.time()
+        Sender(MyCovertChannel(), dict(params, payload=payload)).run()
+        results.put((index, message, payload, start, time.time()))
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at `fraction` of the sorted values, None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_load(send_params, receive_params, senders, args, port):
+    """
+    - Starts `senders` sender processes against one receiver endpoint on `port` and collects their messages.
+    - The processes are started first and wait for the go event, then the local multi-session receiver is started,
+      so it is not forked into every sender. Once it is listening, the senders start at their staggered times. With `--no-receiver` the senders target an external receiver instead.
+    - Returns the report of the step: sent and decoded sessions, latency percentiles and bit rates, and one row per session.
+    """
+    log_dir = tempfile.mkdtemp(prefix="covert_loadgen_")
+    stopping_character = receive_params.get("stopping_character", ".")
+    results = multiprocessing.Queue()
+    go = multiprocessing.Event()
+    start_time = multiprocessing.Value("d")
+    processes = []
+    for index in range(senders):
+        params = dict(
+            send_params, ip=args.ip, port=port, send_engine="udp", lanes=1, frame_size=None, stopping_character=stopping_character,
+            shared_secret=f"{send_params['shared_secret']}:{index}", log_file_name=os.path.join(log_dir, f"sender_{index}.log"),
+            delay_between_bursts=args.delay_between_bursts if args.delay_between_bursts is not None else send_params["delay_between_bursts"],
+            pacer=args.pacer,
+            )
+        process = multiprocessing.Process(
+            target=sender_process,
+            args=(index, params, args.messages, args.size, args.rate, index * args.stagger / 1000, args.seed + index, go, start_time, results),
+            daemon=True
+            )
+        process.start()
+        processes.append(process)
+
+    receiver = None
+    if not args.no_receiver:
+        delays = {
+            name: getattr(args, name) for name in ("delay_waiting_for_burst", "socket_awakening_delay") if getattr(args, name) is not None
+            }
+        receiver = LoadReceiver(MyCovertChannel(), dict(
+            receive_params, ip=args.bind, port=port, receive_engine="sessions", session_limit=senders * args.messages,
+            log_file_name=os.path.join(log_dir, "receiver.log"), **delays
+            ))
+        receiver_thread = threading.Thread(target=receiver.run, daemon=True)
+        receiver_thread.start()
+        time.sleep(args.lead)
+    start_time.value = time.time()
+    go.set()
+
+    sent = []
+    while len(sent) < senders * args.messages and (any(process.is_alive() for process in processes) or not results.empty()):
+        try:
+            sent.append(results.get(timeout=0.5))
+        except queue.Empty:
+            pass
+    for process in processes:
+        process.join()
+    if receiver is not None:
+        receiver_thread.join(timeout=args.timeout)
+        finished = list(zip(receiver.finished_sessions, receiver.finish_times))
+    else:
+        finished = []
+
+    # Sessions are matched to messages by their decoded data, the payloads are random
+    pending = {}
+    for index, message, payload, start, end in sent:
+        pending.setdefault(payload.decode("latin-1") + stopping_character, []).append((index, message, start, end))
+    rows = []
+    for (addr, data, success), finish in finished:
+        if success and pending.get(data):
+            index, message, start, end = pending[data].pop(0)
+            rows.append({"sender": index, "message": message, "source": f"{addr[0]}:{addr[1]}", "success": True,
+                         "latency": finish - start, "send_time": end - start})
+    for data, messages in pending.items():
+        for index, message, start, end in messages:
+            rows.append({"sender": index, "message": message, "source": None, "success": False, "latency": None, "send_time": end - start})
+    rows.sort(key=lambda row: (row["sender"], row["message"]))
+
+    latencies = [row["latency"] for row in rows if row["success"]]
+    first_start = min((start for _, _, _, start, _ in sent), default=None)
+    last_end = max((end for _, _, _, _, end in sent), default=None)
+    last_finish = max((finish for _, finish in finished), default=last_end)
+    sent_bits = len(sent) * args.size * 8
+    decoded_bits = len(latencies) * args.size * 8
+    return {
+        "senders": senders,
+        "sessions": len(sent),
+        "decoded": len(latencies) if receiver is not None else None,
+        "failed": sum(1 for (_, _, success), _ in finished if not success),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p90": percentile(latencies, 0.9),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies, default=None),
+        "offered_bits_per_second": sent_bits / (last_end - first_start) if sent else None,
+        "decoded_bits_per_second": decoded_bits / (last_finish - first_start) if sent and receiver is not None else None,
+        "sessions_log": log_dir,
+        "rows": rows,
+    }
+
+
+def milliseconds(value):
+    """
+    Formats seconds as milliseconds, "-" for None.
+    """
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+def rate(value):
+    """
+    Formats a bit rate, "-" for None.
+    """
+    return f"{value:.1f}" if value is not None else "-"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Starts many sender processes against one receiver to find where the receiver saturates.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--ip", default="127.0.0.1", help="receiver address the senders send to")
+    parser.add_argument("--bind", default="127.0.0.1", help="address the local receiver binds to")
+    parser.add_argument("--port", type=int, help="receiver port, taken from the config by default. Step i of a sweep uses port + i")
+    parser.add_argument("--senders", type=int, nargs="+", default=[10], help="number of sender processes, one step per value")
+    parser.add_argument("--messages", type=int, default=1, help="messages per sender, every message is a session")
+    parser.add_argument("--size", type=int, default=16, help="payload bytes per message")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second per sender, 0 sends them back to back")
+    parser.add_argument("--stagger", type=float, default=50, help="delay between sender starts in ms")
+    parser.add_argument("--lead", type=float, default=0.5, help="seconds the local receiver gets to start listening before the first send")
+    parser.add_argument("--delay-between-bursts", type=float, help="sender delay in ms, taken from the config by default")
+    parser.add_argument("--delay-waiting-for-burst", type=float, help="receiver delay in ms, taken from the config by default")
+    parser.add_argument("--socket-awakening-delay", type=float, help="receiver delay in ms, taken from the config by default")
+    parser.add_argument("--pacer", choices=["deadline", "sleep"], default="sleep",
+                        help="pacer of the senders, the deadline pacer spins and many senders would compete with the receiver for the CPU")
+    parser.add_argument("--no-receiver", action="store_true", help="send to an external receiver, only the sender side is reported")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the receiver after the last sender ended")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="file to write the reports and the per-session rows to")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    send_params = config["send"]["parameters"]
+    receive_params = config["receive"]["parameters"]
+    port = args.port if args.port is not None else receive_params["port"]
+
+    reports = []
+    print(f"{'senders':>7} {'sessions':>8} {'decoded':>7} {'failed':>6} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'max ms':>7} {'offered b/s':>11} {'decoded b/s':>11}")
+    for step, senders in enumerate(args.senders):
+        report = run_load(send_params, receive_params, senders, args, port + step)
+        reports.append(report)
+        decoded = report["decoded"] if report["decoded"] is not None else "-"
+        print(f"{senders:>7} {report['sessions']:>8} {decoded:>7} {report['failed']:>6} "
+              f"{milliseconds(report['latency_p50']):>7} {milliseconds(report['latency_p90']):>7} {milliseconds(report['latency_p99']):>7} "
+              f"{milliseconds(report['latency_max']):>7} {rate(report['offered_bits_per_second']):>11} {rate(report['decoded_bits_per_second']):>11}")
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
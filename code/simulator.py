@@ -0,0 +1,284 @@
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import random
+import selectors
+import time
+from MyCovertChannel import MyCovertChannel, Receiver, Sender
+
+
+class SimulationEnded(Exception):
+    """
+    Raised when the receiver waits for a packet that will never arrive.
+    """
+
+
+class SimClock:
+    """
+    - Virtual clock with the same `time()`, `monotonic()` and `sleep()` functions as the `time` module.
+    - Sleeping advances the virtual time immediately, so no real time passes.
+    """
+    def __init__(self, epoch=1700000000.0):
+        """
+        Starts the clock at virtual time 0. `time()` adds `epoch`, so hash timestamps are the same in every run.
+        """
+        self.epoch = epoch
+        self.now = 0.0
+
+    def reset(self):
+        """
+        Moves the clock back to virtual time 0.
+        """
+        self.now = 0.0
+
+    def time(self):
+        """
+        Returns the virtual wall clock time.
+        """
+        return self.epoch + self.now
+
+    def monotonic(self):
+        """
+        Returns the virtual time since the last reset.
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Advances the virtual time without waiting.
+        """
+        self.now += seconds
+
+
+class SimNetwork:
+    """
+    - Deterministic stand-in for the link between one sender and one receiver.
+    - The sender runs first on the virtual clock. Every packet it sends is given an arrival time,
+      using a seeded random generator for latency, jitter, loss, duplication and reordering.
+    - The receiver runs second, on the same clock reset to 0. Its selector jumps the clock to the next arrival or timeout.
+    - Delays are given in milliseconds, probabilities between 0 and 1.
+    """
+    def __init__(self, latency=1.0, jitter=0.0, loss=0.0, duplication=0.0, reordering=0.0, reorder_delay=5.0, seed=0):
+        """
+        Constructor for the SimNetwork class.
+        """
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.loss = loss
+        self.duplication = duplication
+        self.reordering = reordering
+        self.reorder_delay = reorder_delay / 1000
+        self.rng = random.Random(seed)
+        self.clock = SimClock()
+        self.arrivals = []
+        self.sequence = 0
+        self.sent = 0
+
+    def transmit(self, data):
+        """
+        Schedules the arrival of a packet sent at the current virtual time.
+        """
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            return
+        arrival = self.clock.now + self.latency + self.rng.uniform(0, self.jitter)
+        if self.rng.random() < self.reordering:
+            arrival += self.reorder_delay
+        self.schedule(arrival, data)
+        if self.rng.random() < self.duplication:
+            self.schedule(arrival + self.rng.uniform(0, self.jitter), data)
+
+    def schedule(self, arrival, data):
+        """
+        Pushes a packet to the arrival queue, packets with the same arrival time keep their send order.
+        """
+        heapq.heappush(self.arrivals, (arrival, self.sequence, data))
+        self.sequence += 1
+
+    def socket(self, family=None, type=None):
+        """
+        Socket factory for the sender and the receiver.
+        """
+        return SimSocket(self)
+
+    def selector(self):
+        """
+        Selector factory for the receiver.
+        """
+        return SimSelector(self)
+
+
+class SimSocket:
+    """
+    Simulated UDP socket with the calls used by `Sender` and `BurstSegmenter`.
+    """
+    def __init__(self, network):
+        self.network = network
+
+    def connect(self, address):
+        """
+        There is only one receiver, so the address is not used.
+        """
+
+    def bind(self, address):
+        """
+        There is only one receiver, so the address is not used.
+        """
+
+    def setblocking(self, flag):
+        """
+        The simulated socket never blocks, waiting is done by `SimSelector`.
+        """
+
+    def settimeout(self, timeout):
+        """
+        The simulated socket never blocks, waiting is done by `SimSelector`.
+        """
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
+    def send(self, data):
+        """
+        Hands the packet to the network at the current virtual time.
+        """
+        self.network.transmit(data)
+        return len(data)
+
+    def recv_into(self, buffer):
+        """
+        Returns the next packet that has arrived by the current virtual time, or raises BlockingIOError.
+        """
+        arrivals = self.network.arrivals
+        if not arrivals or arrivals[0][0] > self.network.clock.now:
+            raise BlockingIOError
+        _, _, data = heapq.heappop(arrivals)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class SimSelector:
+    """
+    Simulated selector. Waiting moves the virtual clock to the next arrival or to the timeout, whichever is first.
+    """
+    def __init__(self, network):
+        self.network = network
+        self.key = None
+
+    def register(self, fileobj, events):
+        """
+        Registers the receiver socket, there is only one.
+        """
+        self.key = selectors.SelectorKey(fileobj, 0, events, None)
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
+    def select(self, timeout=None):
+        """
+        Returns the read event if a packet has arrived by the new virtual time, an empty list on timeout.
+        Raises SimulationEnded if it would wait forever.
+        """
+        clock = self.network.clock
+        arrivals = self.network.arrivals
+        if arrivals and arrivals[0][0] <= clock.now:
+            return [(self.key, selectors.EVENT_READ)]
+        if timeout is None:
+            if not arrivals:
+                raise SimulationEnded("No more packets will arrive")
+            clock.now = arrivals[0][0]
+            return [(self.key, selectors.EVENT_READ)]
+        deadline = clock.now + timeout
+        if arrivals and arrivals[0][0] <= deadline:
+            clock.now = arrivals[0][0]
+            return [(self.key, selectors.EVENT_READ)]
+        clock.now = deadline
+        return []
+
+
+def run_simulation(send_params, receive_params, message, network):
+    """
+    - Runs the real `Sender` and `Receiver` against a `SimNetwork` in-process.
+    - `message` is sent as the sender payload, the stopping character is appended by the sender.
+    - Calibration needs a reply from the receiver while the sender runs, so it is turned off.
+      The virtual clock only moves when slept on, so the pacer does not spin.
+    - Returns (sender, receiver, virtual duration of the transfer in seconds).
+    """
+    send_params = dict(send_params, send_engine="udp", payload=message, log_file_name=os.devnull, calibration_probes=0, pacer_spin=0,
+                       clock=network.clock, socket_factory=network.socket)
+    receive_params = dict(receive_params, receive_engine="segmenter", log_file_name=os.devnull, sink=None, calibration_probes=0,
+                          clock=network.clock, socket_factory=network.socket, selector_factory=network.selector)
+    sender = Sender(MyCovertChannel(), send_params)
+    receiver = Receiver(MyCovertChannel(), receive_params)
+
+    network.clock.reset()
+    sender.run()
+    duration = network.clock.now
+    network.clock.reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver.run()
+    return sender, receiver, duration
+
+
+def simulate(send_params, receive_params, message, network):
+    """
+    - Runs one transfer with `run_simulation`.
+    - Returns (correct, received bytes, virtual duration of the transfer in seconds).
+    - In the framed mode the received bytes are the frames that arrived, in index order. With a `coding` they are the decoded characters.
+    """
+    _, receiver, duration = run_simulation(send_params, receive_params, message, network)
+    if receiver.coder is not None:
+        received = bytes(receiver.decoded)
+    elif receiver.frame_size is not None:
+        received = b"".join(receiver.frames[index] for index in sorted(receiver.frames))
+    else:
+        received = bytes(receiver.codec.output) if getattr(receiver, "codec", None) is not None else b""
+    expected = bytes(message) + receiver.stopping_character.encode()
+    return received == expected and receiver.error is None, received, duration
+
+
+def load_params(config_file):
+    """
+    Reads the send and receive parameters from the config file.
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+    return config["send"]["parameters"], config["receive"]["parameters"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the covert channel many times on a simulated network.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--length", type=int, default=16, help="message length in characters, without the stopping character")
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--duplication", type=float, default=0.0)
+    parser.add_argument("--reordering", type=float, default=0.0)
+    parser.add_argument("--reorder-delay", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    send_params, receive_params = load_params(args.config)
+    alphabet = [byte for byte in range(32, 127) if byte != ord(receive_params["stopping_character"])]
+    rng = random.Random(args.seed)
+    correct = 0
+    virtual_time = 0.0
+    start = time.perf_counter()
+    for run in range(args.runs):
+        message = bytes(rng.choice(alphabet) for _ in range(args.length))
+        network = SimNetwork(args.latency, args.jitter, args.loss, args.duplication, args.reordering, args.reorder_delay, seed=args.seed + run)
+        ok, _, duration = simulate(send_params, receive_params, message, network)
+        correct += ok
+        virtual_time += duration
+    elapsed = time.perf_counter() - start
+    print(f"{correct}/{args.runs} runs decoded correctly")
+    print(f"{virtual_time:.1f}s of simulated transfers in {elapsed:.2f}s of wall time")